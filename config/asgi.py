@@ -5,12 +5,32 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+
+Run with: uvicorn config.asgi:application --workers $ASGI_WORKERS
+
+Синхронные представления под ASGI выполняются в потоке, который Django выделяет запросу
+(ThreadSensitiveContext): один поток и одно соединение с базой на каждый одновременный
+синхронный запрос процесса, соединений не больше DB_POOL_MAX_SIZE. Потоковая выгрузка
+отдается асинхронным итератором (habits.export.aiter_chunks), иначе Django собрал бы ее в память.
+Для отдельного масштабирования синхронных эндпоинтов есть WSGI (config.wsgi, сервис app-wsgi).
+uvicorn не раздает статику, поэтому /static/ (админка, Swagger и ReDoc) отдает
+ASGIStaticFilesHandler из django.contrib.staticfiles, если включен SERVE_STATIC.
 """
 
+import atexit
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+if settings.SERVE_STATIC:
+    application = ASGIStaticFilesHandler(application)
+
+from habits.metrics import mark_process_dead  # noqa: E402
+
+# у uvicorn нет хука завершения воркера, воркер отмечает себя сам при выходе
+atexit.register(mark_process_dead, os.getpid())
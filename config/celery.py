@@ -1,9 +1,17 @@
 from __future__ import absolute_import,unicode_literals
 import os
 from celery import Celery
+from celery.signals import worker_process_shutdown
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE','config.settings')
 
 app = Celery('config')
 app.config_from_object('django.conf:settings',namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    # приложения Django к моменту импорта этого модуля еще не загружены
+    from habits.metrics import mark_process_dead
+    mark_process_dead(pid)
@@ -0,0 +1,12 @@
+"""
+Настройки gunicorn: gunicorn -c python:config.gunicorn config.wsgi:application
+"""
+import os
+
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # файлы живых gauge завершившегося воркера больше не нужны
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
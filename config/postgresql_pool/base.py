@@ -0,0 +1,94 @@
+import os
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from config.postgresql_pool.pool import ConnectionPool
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(key, connect, options):
+    """
+    Пул процесса для базы key. В дочернем процессе после fork (prefork Celery, воркеры uvicorn)
+    унаследованный пул забывается и создается новый
+    """
+    with pools_lock:
+        pool = pools.get(key)
+        if pool is not None and pool.pid != os.getpid():
+            pool.abandon()
+            pool = None
+        if pool is None:
+            pool = pools[key] = ConnectionPool(connect, **options)
+        return pool
+
+
+def close_pool(alias=None):
+    """
+    Закрывает пулы процесса (или только пулы базы alias): простаивающие соединения сразу,
+    выданные - когда их вернут. Следующее подключение создаст новый пул.
+    Нужно, когда к базе не должно остаться сессий, например перед DROP DATABASE
+    """
+    with pools_lock:
+        closing = [key for key in pools if alias is None or key[0] == alias]
+        closing = [pools.pop(key) for key in closing]
+    for pool in closing:
+        if pool.pid == os.getpid():
+            pool.close()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """
+    Создание и удаление тестовой базы. Сессии из пула мешают DROP DATABASE и CREATE DATABASE ... TEMPLATE,
+    поэтому перед ними пулы закрываются
+    """
+
+    def _create_test_db(self, verbosity, autoclobber, keepdb=False):
+        close_pool()
+        return super()._create_test_db(verbosity, autoclobber, keepdb)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        close_pool()
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        close_pool()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Бэкенд PostgreSQL (psycopg2) с пулом соединений. Параметры пула задаются в OPTIONS['pool'].
+    Закрытие соединения Django (в конце запроса и задачи при CONN_MAX_AGE = 0) возвращает его в пул
+    """
+
+    creation_class = DatabaseCreation
+    pool = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        key = (self.alias, *sorted((name, str(value)) for name, value in conn_params.items()))
+        self.pool = get_pool(key, lambda: self.connect_pool(conn_params), self.settings_dict['OPTIONS'].get('pool', {}))
+        connection = self.pool.getconn()
+        # для соединения из пула уровень изоляции не задается в get_new_connection, а нужен _set_autocommit
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED)
+        try:
+            self.isolation_level = IsolationLevel(isolation_level)
+        except ValueError:
+            raise ImproperlyConfigured(f'Invalid transaction isolation level {isolation_level}')
+        return connection
+
+    def connect_pool(self, conn_params):
+        return super().get_new_connection(conn_params)
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from collections import deque
+
+from psycopg2 import Error, OperationalError, extensions
+
+# соединения, которые нельзя ни закрыть, ни удалить (см. abandon_connection)
+orphans = []
+
+
+class ConnectionPool:
+    """
+    Пул соединений psycopg2 одного процесса. Соединения создаются по требованию,
+    одновременно открыто не больше max_size. Простаивающие соединения сверх min_size
+    закрываются через max_idle секунд, перед выдачей соединение, простоявшее дольше
+    check_interval секунд, проверяется запросом SELECT 1
+    """
+
+    def __init__(self, connect, min_size=0, max_size=10, timeout=10, max_idle=300, check_interval=30):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self.pid = os.getpid()
+        self.size = 0
+        self.closed = False
+        # последним возвращенное соединение выдается первым, лишние дольше простаивают и закрываются
+        self.idle = deque()
+        # inode сокета каждого соединения, чтобы после fork не закрыть чужой дескриптор с тем же номером
+        self.sockets = {}
+        self.condition = threading.Condition()
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                self._close_idle()
+                if self.idle:
+                    connection, returned_at = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    connection = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise OperationalError(f'Нет свободных соединений в пуле за {self.timeout} с')
+                self.condition.wait(remaining)
+
+        if connection is not None:
+            if self._is_usable(connection, returned_at):
+                return connection
+            self._discard(connection)
+            # вместо сломанного соединения открывается новое, место в пуле уже занято
+            with self.condition:
+                self.size += 1
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        self.sockets[id(connection)] = socket_inode(connection.fileno())
+        return connection
+
+    def putconn(self, connection):
+        if self.pid != os.getpid():
+            # соединение открыто в родительском процессе до fork
+            self.abandon_connection(connection)
+            return
+        if not connection.closed:
+            try:
+                if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except Error:
+                pass
+        if (self.closed or connection.closed
+                or connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE):
+            self._discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def close(self):
+        """
+        Закрывает простаивающие соединения. Выданные соединения закрываются, когда их вернут
+        """
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def abandon(self):
+        """
+        Забыть соединения пула в дочернем процессе после fork, не завершая сессии родителя
+        """
+        idle, self.idle = self.idle, deque()
+        for connection, _ in idle:
+            self.abandon_connection(connection)
+
+    def abandon_connection(self, connection):
+        """
+        Закрывает копию сокета, унаследованную при fork. close() у соединения отправил бы серверу
+        завершение сессии, которой пользуется родитель, поэтому дескриптор сначала подменяется
+        на /dev/null. libpq закрывает его сам, ровно один раз
+        """
+        if connection.closed:
+            return
+        fd = connection.fileno()
+        inode = self.sockets.pop(id(connection), None)
+        try:
+            reused = os.fstat(fd).st_ino != inode
+        except OSError:
+            # дескриптор уже закрыт (так делает Celery для соединений Django), номер свободен
+            reused = False
+        if reused:
+            # номер занял другой файл, libpq закрыл бы его при close() или удалении соединения
+            orphans.append(connection)
+            return
+        devnull = os.open(os.devnull, os.O_RDWR)
+        if devnull != fd:
+            os.dup2(devnull, fd)
+            os.close(devnull)
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def _is_usable(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Error:
+            return False
+        return True
+
+    def _close_idle(self):
+        # вызывается под self.condition; самые старые соединения в начале очереди
+        expired = time.monotonic() - self.max_idle
+        while len(self.idle) > self.min_size and self.idle[0][1] < expired:
+            connection, _ = self.idle.popleft()
+            self.size -= 1
+            self.sockets.pop(id(connection), None)
+            connection.close()
+
+    def _discard(self, connection):
+        self.sockets.pop(id(connection), None)
+        try:
+            connection.close()
+        except Error:
+            pass
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+
+def socket_inode(fd):
+    try:
+        return os.fstat(fd).st_ino
+    except OSError:
+        return None
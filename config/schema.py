@@ -0,0 +1,84 @@
+import hashlib
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+
+# (содержимое, ETag) схемы в памяти процесса
+schema = None
+
+
+def get_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="Snippets API",
+        default_version='v1',
+        description="Test description",
+        terms_of_service="https://www.google.com/policies/terms/",
+        contact=openapi.Contact(email="contact@snippets.local"),
+        license=openapi.License(name="BSD License"),
+    )
+
+
+def generate_schema():
+    """
+    OpenAPI схема всех эндпоинтов в JSON. drf_yasg импортируется здесь, а не при загрузке urls,
+    чтобы не замедлять запуск воркеров
+    """
+    from drf_yasg.app_settings import swagger_settings
+    from django.test import RequestFactory
+    from drf_yasg.codecs import OpenAPICodecJson
+    from rest_framework.views import APIView
+
+    # представлениям нужен запрос, как при генерации по запросу анонимного пользователя.
+    # Адрес сервера в схему не попадает, если не задан DEFAULT_API_URL
+    request = APIView().initialize_request(RequestFactory().get('/swagger.json'))
+    generator = swagger_settings.DEFAULT_GENERATOR_CLASS(get_info(), url=swagger_settings.DEFAULT_API_URL or '')
+    return OpenAPICodecJson(validators=[]).encode(generator.get_schema(request, public=True))
+
+
+def get_schema():
+    """
+    Схема из файла OPENAPI_SCHEMA_PATH (команда generate_schema), если его нет - генерируется
+    при первом обращении. Дальше отдается из памяти
+    """
+    global schema
+    if schema is None:
+        path = Path(settings.OPENAPI_SCHEMA_PATH)
+        content = path.read_bytes() if path.exists() else generate_schema()
+        schema = (content, f'"{hashlib.md5(content).hexdigest()}"')
+    return schema
+
+
+@require_safe
+def schema_json_view(request):
+    content, etag = get_schema()
+    response = get_conditional_response(request, etag=etag) or HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.OPENAPI_SCHEMA_CACHE_TIMEOUT)
+    return response
+
+
+def get_ui_view(renderer):
+    """
+    Страница Swagger UI или ReDoc. Сама схема на странице не строится, ее загружает браузер
+    по адресу schema-json (SPEC_URL в SWAGGER_SETTINGS и REDOC_SETTINGS)
+    """
+    view = None
+
+    def ui_view(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            from drf_yasg.views import UI_RENDERERS, get_schema_view
+            from rest_framework import permissions
+
+            schema_view = get_schema_view(get_info(), public=True, permission_classes=(permissions.AllowAny,))
+            # без JSON и YAML рендереров: ?format=openapi не запускает генерацию схемы
+            view = schema_view.as_cached_view(settings.OPENAPI_SCHEMA_CACHE_TIMEOUT,
+                                              renderer_classes=UI_RENDERERS[renderer])
+        return view(request, *args, **kwargs)
+
+    return ui_view
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework_simplejwt',
@@ -85,14 +86,26 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# соединения берутся из пула процесса (config.postgresql_pool) и возвращаются в него в конце запроса
+# и задачи Celery, поэтому CONN_MAX_AGE = 0. Соединений с базой не больше DB_POOL_MAX_SIZE на процесс
 DATABASES = {
    'default': {
-       'ENGINE': 'django.db.backends.postgresql',
+       'ENGINE': 'config.postgresql_pool',
        'NAME': os.getenv('POSTGRES_DB_NAME'),
        'USER': os.getenv('POSTGRES_BD_USER'),
        'PASSWORD': os.getenv('POSTGRES_BD_PASSWORD'),
        'HOST': os.getenv('POSTGRES_HOST'),
        'PORT': os.getenv('POSTGRES_PORT'),
+       'CONN_MAX_AGE': 0,
+       'OPTIONS': {
+           'pool': {
+               'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),  # простаивающих соединений не закрывается
+               'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),  # соединений на процесс
+               'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),  # ожидание свободного соединения, секунд
+               'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 300)),  # простой до закрытия соединения, секунд
+               'check_interval': float(os.getenv('DB_POOL_CHECK_INTERVAL', 30)),  # простой до проверки SELECT 1
+           },
+       },
    }
 }
 # Password validation
@@ -128,6 +141,7 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
 STATIC_URL = 'static/'
+SERVE_STATIC = os.getenv('SERVE_STATIC', 'True') == 'True'  # uvicorn и gunicorn не раздают статику, False - ее раздает прокси
 
 STATICFILES = (BASE_DIR / "static",)
 
@@ -144,7 +158,7 @@ LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework_simplejwt.authentication.JWTAuthentication'],
+    'DEFAULT_AUTHENTICATION_CLASSES': ['users.authentication.CachedJWTAuthentication'],
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
 }
 
@@ -166,6 +180,40 @@ CSRF_TRUSTED_ORIGINS = [
 
 CORS_ALLOW_ALL_ORIGINS = False
 
+# Кэш ответов API: Redis, если задан CACHE_LOCATION, иначе память процесса
+if os.getenv('CACHE_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_LOCATION'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+USERS_AUTH_CACHE_TIMEOUT = int(os.getenv('USERS_AUTH_CACHE_TIMEOUT', 300))  # время жизни данных для аутентификации в общем кэше, секунд
+USERS_AUTH_LOCAL_TIMEOUT = int(os.getenv('USERS_AUTH_LOCAL_TIMEOUT', 5))  # время жизни данных для аутентификации в памяти процесса
+USERS_AUTH_LOCAL_SIZE = int(os.getenv('USERS_AUTH_LOCAL_SIZE', 10000))  # пользователей в памяти процесса
+USERS_BULK_MAX_SIZE = int(os.getenv('USERS_BULK_MAX_SIZE', 1000))  # пользователей в одном пакетном запросе
+USERS_HASH_WORKERS = int(os.getenv('USERS_HASH_WORKERS', 0))  # процессов для хэширования паролей в provision_users, 0 - по числу ядер
+USERS_HASH_THREADS = int(os.getenv('USERS_HASH_THREADS', 2))  # потоков процесса для хэширования паролей в запросах
+
+OPENAPI_SCHEMA_PATH = os.getenv('OPENAPI_SCHEMA_PATH', BASE_DIR / 'openapi.json')  # файл схемы, см. generate_schema
+OPENAPI_SCHEMA_CACHE_TIMEOUT = int(os.getenv('OPENAPI_SCHEMA_CACHE_TIMEOUT', 3600))  # кэширование документации, секунд
+# Swagger UI и ReDoc загружают готовую схему
+SWAGGER_SETTINGS = {'SPEC_URL': 'schema-json'}
+REDOC_SETTINGS = {'SPEC_URL': 'schema-json'}
+
+HABITS_CACHE_TIMEOUT = int(os.getenv('HABITS_CACHE_TIMEOUT', 60))  # время жизни закэшированного ответа, секунд
+HABITS_CACHE_LOCK_TIMEOUT = int(os.getenv('HABITS_CACHE_LOCK_TIMEOUT', 5))  # ожидание ответа, который строит другой запрос
+HABITS_BULK_MAX_SIZE = int(os.getenv('HABITS_BULK_MAX_SIZE', 1000))  # привычек в одном пакетном запросе
+HABITS_EXPORT_CHUNK_SIZE = int(os.getenv('HABITS_EXPORT_CHUNK_SIZE', 2000))  # привычек в одной пачке выгрузки
+HABITS_COMPLETION_PARTITIONS_AHEAD = int(os.getenv('HABITS_COMPLETION_PARTITIONS_AHEAD', 3))  # секций выполнений на месяцы вперед
+
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
 CELERY_TIMEZONE = "Europe/Moscow"
@@ -174,14 +222,60 @@ CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 
+CELERY_TASK_ROUTES = {
+    'habits.tasks.send_tg_chunk': {'queue': 'notifications'},
+    'habits.tasks.sum_chunk_results': {'queue': 'notifications'},
+    'habits.tasks.deliver_pending_notifications': {'queue': 'notifications'},
+}
+
 CELERY_BEAT_SCHEDULE = {
     'send-tg-message-every-10-minutes': {
         'task': 'habits.tasks.send_tg_message',
         'schedule': timedelta(minutes=10),  # запуск каждые 10 минут
     },
+    'deliver-pending-notifications-every-minute': {
+        'task': 'habits.tasks.deliver_pending_notifications',
+        'schedule': timedelta(minutes=1),
+    },
+    'purge-sent-notifications-daily': {
+        'task': 'habits.tasks.purge_sent_notifications',
+        'schedule': timedelta(days=1),
+    },
+    'process-telegram-updates-every-minute': {
+        'task': 'habits.tasks.process_telegram_updates',
+        'schedule': timedelta(minutes=1),
+    },
+    'reset-broken-streaks-daily': {
+        'task': 'habits.tasks.reset_broken_streaks',
+        'schedule': timedelta(days=1),
+    },
+    'create-completion-partitions-daily': {
+        'task': 'habits.tasks.create_completion_partitions',
+        'schedule': timedelta(days=1),
+    },
 }
 
 TOKEN_BOT = os.getenv('TOKEN_BOT')
 TELEGRAM_URL = os.getenv('TELEGRAM_URL')
+TELEGRAM_TIMEOUT = float(os.getenv('TELEGRAM_TIMEOUT', 10))
+TELEGRAM_CONCURRENCY = int(os.getenv('TELEGRAM_CONCURRENCY', 100))  # одновременных запросов к API
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))  # сообщений в секунду на бота, 0 - без ограничения
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))  # сообщений в секунду в один чат
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', 3))
+TELEGRAM_POLL_TIMEOUT = int(os.getenv('TELEGRAM_POLL_TIMEOUT', 30))  # ожидание в long polling, секунд
+TELEGRAM_UPDATES_BATCH_SIZE = int(os.getenv('TELEGRAM_UPDATES_BATCH_SIZE', 500))
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')  # без секрета webhook отклоняет все запросы
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # токен Prometheus для /metrics/, без токена метрики не отдаются
+
+REMINDER_CHUNK_SIZE = int(os.getenv('REMINDER_CHUNK_SIZE', 1000))  # привычек в одной подзадаче отправки
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', 500))  # привычек в одной пачке внутри подзадачи
+REMINDER_DIGEST = os.getenv('REMINDER_DIGEST', 'False') == 'True'  # одно сообщение на чат вместо сообщения на привычку
+REMINDER_DIGEST_MAX_HABITS = int(os.getenv('REMINDER_DIGEST_MAX_HABITS', 10))  # привычек в одном сообщении
+
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_RETRY_DELAY = int(os.getenv('OUTBOX_RETRY_DELAY', 60))  # задержка первой повторной попытки, секунд
+OUTBOX_LEASE = int(os.getenv('OUTBOX_LEASE', 300))  # на сколько секунд обработчик забирает напоминания
+OUTBOX_KEEP_DAYS = int(os.getenv('OUTBOX_KEEP_DAYS', 7))
 
 
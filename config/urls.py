@@ -16,28 +16,18 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Snippets API",
-        default_version='v1',
-        description="Test description",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="contact@snippets.local"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from config.schema import get_ui_view, schema_json_view
+from habits.views import MetricsAPIView, TelegramWebhookAPIView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('users/', include('users.urls', namespace="users")),
     path('habits/', include('habits.urls', namespace="habits")),
+    path('telegram/webhook/', TelegramWebhookAPIView.as_view(), name='telegram_webhook'),
+    path('metrics/', MetricsAPIView.as_view(), name='metrics'),
 
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('swagger.json', schema_json_view, name='schema-json'),
+    path('swagger/', get_ui_view('swagger'), name='schema-swagger-ui'),
+    path('redoc/', get_ui_view('redoc'), name='schema-redoc'),
 ]
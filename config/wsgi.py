@@ -5,12 +5,18 @@ It exposes the WSGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
+
+/static/ отдает StaticFilesHandler из django.contrib.staticfiles, если включен SERVE_STATIC.
 """
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import StaticFilesHandler
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+if settings.SERVE_STATIC:
+    application = StaticFilesHandler(application)
@@ -0,0 +1,8 @@
+#!/bin/sh
+# У каждого контейнера свой каталог метрик prometheus_client: файлы называются по PID,
+# а PID в разных контейнерах совпадают. Файлы прошлого запуска удаляются
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+exec "$@"
@@ -0,0 +1,194 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+VERSION_KEY = 'habits:version:{}'
+RESPONSE_KEY = 'habits:response:{}:{}:{}'
+
+
+def get_version(scope):
+    """
+    Текущая версия области кэша (public, owner:<id>, habit:<id>)
+    """
+    key = VERSION_KEY.format(scope)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_version(scope):
+    """
+    Асинхронный вариант get_version
+    """
+    key = VERSION_KEY.format(scope)
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(key, version, timeout=None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def bump_versions(scopes):
+    """
+    Меняет версии областей кэша одним запросом, старые ответы перестают читаться и истекают сами
+    """
+    version = time.time_ns()
+    cache.set_many({VERSION_KEY.format(scope): version for scope in set(scopes)}, timeout=None)
+
+
+def invalidate(scopes):
+    """
+    Сбрасывает кэш сразу и еще раз после фиксации транзакции, чтобы ответ,
+    собранный конкурентным запросом по еще не зафиксированным данным, не остался в кэше
+    """
+    scopes = set(scopes)
+    bump_versions(scopes)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: bump_versions(scopes))
+
+
+def get_habit_scopes(habits):
+    """
+    Области кэша, затронутые изменением привычек (экземпляров или словарей с id, owner_id и is_public).
+    Публичный список сбрасывается, только если привычка публичная или была публичной при загрузке,
+    а если признак не загружен - на всякий случай
+    """
+    scopes = set()
+    for habit in habits:
+        if isinstance(habit, dict):
+            pk, owner_id, public = habit['id'], habit['owner_id'], habit.get('is_public', True)
+        else:
+            pk, owner_id = habit.id, habit.owner_id
+            public = ('is_public' in habit.get_deferred_fields() or habit.is_public
+                      or getattr(habit, 'was_public', False))
+        scopes.update((f'owner:{owner_id}', f'habit:{pk}'))
+        if public:
+            scopes.add('public')
+    return scopes
+
+
+def get_or_compute(key, compute):
+    """
+    Значение из кэша или результат compute(). При промахе значение вычисляет один процесс,
+    остальные ждут его появления в кэше, а не идут в базу одновременно
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, timeout=settings.HABITS_CACHE_LOCK_TIMEOUT):
+        try:
+            value = compute()
+            if value is not None:
+                cache.set(key, value, timeout=settings.HABITS_CACHE_TIMEOUT)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + settings.HABITS_CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return compute()
+
+
+async def aget_or_compute(key, compute):
+    """
+    Асинхронный вариант get_or_compute, compute - корутинная функция
+    """
+    value = await cache.aget(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, timeout=settings.HABITS_CACHE_LOCK_TIMEOUT):
+        try:
+            value = await compute()
+            if value is not None:
+                await cache.aset(key, value, timeout=settings.HABITS_CACHE_TIMEOUT)
+            return value
+        finally:
+            await cache.adelete(lock_key)
+
+    deadline = time.monotonic() + settings.HABITS_CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        value = await cache.aget(key)
+        if value is not None:
+            return value
+    return await compute()
+
+
+class CachedResponseMixin:
+    """
+    Кэширование готового JSON ответа на GET запрос.
+    Ключ строится из области кэша get_cache_scope() и ее версии, поэтому
+    изменение привычек делает старые ответы недоступными без перебора ключей
+    """
+
+    def get_cache_scope(self):
+        """
+        Область кэша для текущего запроса, None - ответ не кэшируется
+        """
+        raise NotImplementedError
+
+    def get_cache_vary(self):
+        """
+        Часть ключа, зависящая от пользователя
+        """
+        return ''
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        scope = self.get_cache_scope()
+        if scope is None or request.accepted_renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+
+        key = RESPONSE_KEY.format(scope, get_version(scope),
+                                  f'{self.get_cache_vary()}:{request.build_absolute_uri()}')
+        response = None
+
+        def render():
+            nonlocal response
+            response = handler(request, *args, **kwargs)
+            if response.status_code == 200:
+                return JSONRenderer().render(response.data)
+
+        body = get_or_compute(key, render)
+        if response is not None:
+            return response
+        return HttpResponse(body, content_type='application/json')
+
+    async def acached_response(self, handler, request, *args, **kwargs):
+        """
+        Вариант cached_response для асинхронного handler, ожидание ответа не занимает поток
+        """
+        scope = self.get_cache_scope()
+        if scope is None or request.accepted_renderer.format != 'json':
+            return await handler(request, *args, **kwargs)
+
+        key = RESPONSE_KEY.format(scope, await aget_version(scope),
+                                  f'{self.get_cache_vary()}:{request.build_absolute_uri()}')
+        response = None
+
+        async def render():
+            nonlocal response
+            response = await handler(request, *args, **kwargs)
+            if response.status_code == 200:
+                return JSONRenderer().render(response.data)
+
+        body = await aget_or_compute(key, render)
+        if response is not None:
+            return response
+        return HttpResponse(body, content_type='application/json')
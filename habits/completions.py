@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from habits.models import HabitCompletion, Habits
+
+COMPLETION_TABLE = HabitCompletion._meta.db_table
+STREAK_FIELDS = ('current_streak', 'best_streak', 'total_completions', 'last_completed_on')
+
+
+def complete_habit(habit_id, completed_on=None):
+    """
+    Отмечает выполнение привычки за день и в той же транзакции обновляет счетчики серии.
+    Строка привычки блокируется, поэтому одновременные отметки не теряют обновления счетчиков.
+    Возвращает привычку и признак новой отметки (False, если за этот день отметка уже есть)
+    """
+    completed_on = completed_on or timezone.localdate()
+    with transaction.atomic():
+        habit = Habits.objects.select_for_update().get(pk=habit_id)
+        _, created = HabitCompletion.objects.get_or_create(habit_id=habit.pk, completed_on=completed_on)
+        if not created:
+            return habit, False
+
+        periodicity = max(habit.periodicity or 1, 1)
+        if habit.last_completed_on is None or completed_on > habit.last_completed_on:
+            # обычный случай: новая отметка продолжает или начинает серию без чтения истории
+            gap = (completed_on - habit.last_completed_on).days if habit.last_completed_on else None
+            habit.current_streak = habit.current_streak + 1 if gap is not None and gap <= periodicity else 1
+            habit.last_completed_on = completed_on
+        else:
+            # отметка задним числом может соединить серии, поэтому они пересчитываются по истории
+            dates = (HabitCompletion.objects.filter(habit_id=habit.pk).order_by('completed_on')
+                     .values_list('completed_on', flat=True))
+            habit.current_streak, best_streak = get_streaks(dates, periodicity)
+            habit.best_streak = max(habit.best_streak, best_streak)
+            if is_streak_broken(habit.last_completed_on, periodicity):
+                habit.current_streak = 0
+        habit.best_streak = max(habit.best_streak, habit.current_streak)
+        habit.total_completions += 1
+        habit.save(update_fields=[*STREAK_FIELDS, 'updated_at'])
+    return habit, True
+
+
+def get_streaks(dates, periodicity):
+    """
+    Последняя и лучшая серии по отсортированным датам выполнения.
+    Серия продолжается, если между выполнениями прошло не больше periodicity дней
+    """
+    current = best = 0
+    previous = None
+    for day in dates:
+        current = current + 1 if previous is not None and (day - previous).days <= periodicity else 1
+        best = max(best, current)
+        previous = day
+    return current, best
+
+
+def is_streak_broken(last_completed_on, periodicity, today=None):
+    today = today or timezone.localdate()
+    return last_completed_on is not None and (today - last_completed_on).days > periodicity
+
+
+def create_partitions(cursor, first_month, months):
+    """
+    Создает месячные секции таблицы выполнений (только PostgreSQL), начиная с месяца first_month.
+    Даты вне созданных секций попадают в секцию по умолчанию
+    """
+    month = first_month.replace(day=1)
+    for _ in range(months):
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {COMPLETION_TABLE}_{month:%Y_%m} PARTITION OF {COMPLETION_TABLE} "
+                       f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')")
+        month = next_month
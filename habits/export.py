@@ -0,0 +1,85 @@
+import csv
+import io
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+# поле в выгрузке -> колонка в базе
+EXPORT_COLUMNS = {
+    'id': 'id',
+    'owner': 'owner_id',
+    'place': 'place',
+    'time': 'time',
+    'action': 'action',
+    'is_pleasant_habit': 'is_pleasant_habit',
+    'related_habit': 'related_habit_id',
+    'periodicity': 'periodicity',
+    'reward': 'reward',
+    'time_to_complete': 'time_to_complete',
+    'is_public': 'is_public',
+    'next_run_at': 'next_run_at',
+    'updated_at': 'updated_at',
+}
+
+
+def iter_batches(queryset, chunk_size):
+    """
+    Кортежи значений привычек пачками по chunk_size. Записи читаются курсором,
+    поэтому в памяти одновременно находится только одна пачка
+    """
+    batch = []
+    for row in queryset.order_by('id').values_list(*EXPORT_COLUMNS.values()).iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) == chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_ndjson(batches):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    fields = list(EXPORT_COLUMNS)
+    for batch in batches:
+        yield ''.join(encoder.encode(dict(zip(fields, row))) + '\n' for row in batch).encode()
+
+
+def iter_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def iter_gzip(chunks):
+    """
+    Сжатие потока в формате gzip по мере генерации
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+async def aiter_chunks(chunks):
+    """
+    Асинхронный поток выгрузки для ASGI. Синхронный поток Django под ASGI сначала читает целиком
+    в память, а здесь каждая пачка готовится в потоке запроса (там же его соединение с базой)
+    и сразу отправляется клиенту
+    """
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+EXPORT_FORMATS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'csv': (iter_csv, 'text/csv'),
+}
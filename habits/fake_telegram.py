@@ -0,0 +1,144 @@
+import asyncio
+import json
+import multiprocessing
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeTelegramServer:
+    """
+    Локальная замена Telegram Bot API для нагрузочного тестирования.
+    Поддерживает методы sendMessage и getUpdates, задержку ответа (latency, секунд),
+    ответы 429 (rate_limit_rate) и 500 (error_rate) с заданной долей
+    и ответы 403 для чатов, заблокировавших бота (blocked_chats)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, rate_limit_rate=0, error_rate=0, retry_after=1,
+                 updates=None, blocked_chats=()):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.updates = list(updates or [])
+        self.blocked_chats = {str(chat_id) for chat_id in blocked_chats}
+        self.requests = 0
+        self.sent = 0
+        self.loop = None
+        self.stopped = None
+        self.thread = None
+        self.process = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/bot'
+
+    def serve_forever(self, on_ready=None):
+        asyncio.run(self.serve(on_ready))
+
+    async def serve(self, on_ready=None):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=1024)
+        self.port = server.sockets[0].getsockname()[1]
+        if on_ready:
+            on_ready(self.port)
+        async with server:
+            await self.stopped.wait()
+
+    def start(self):
+        """
+        Запуск сервера в отдельном потоке текущего процесса
+        """
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve_forever, args=(lambda port: ready.set(),), daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def start_process(self):
+        """
+        Запуск сервера в отдельном процессе, чтобы он не конкурировал с клиентом за GIL
+        """
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(target=self.serve_forever, args=(sender.send,), daemon=True)
+        self.process.start()
+        self.port = receiver.recv()
+        return self
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.join()
+        elif self.thread:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, value = line.decode('latin-1').split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                code, data = await self.handle_request(target, headers, body)
+                payload = json.dumps(data).encode()
+                writer.write(f'HTTP/1.1 {code} {"OK" if code == 200 else "Error"}\r\n'
+                             f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'
+                             .encode('latin-1') + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, target, headers, body):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        url = urlsplit(target)
+        params = {key: value[0] for key, value in parse_qs(url.query).items()}
+        if headers.get('content-type', '').startswith('application/json'):
+            params.update(json.loads(body or b'{}'))
+        elif body:
+            params.update({key: value[0] for key, value in parse_qs(body.decode()).items()})
+
+        method = url.path.rsplit('/', 1)[-1]
+        if method == 'sendMessage':
+            return self.send_message(params)
+        if method == 'getUpdates':
+            offset = int(params.get('offset') or 0)
+            return 200, {'ok': True, 'result': [u for u in self.updates if u['update_id'] >= offset]}
+        return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+
+    def send_message(self, params):
+        if str(params.get('chat_id')) in self.blocked_chats:
+            return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+        if random.random() < self.rate_limit_rate:
+            return 429, {'ok': False, 'error_code': 429,
+                         'description': f'Too Many Requests: retry after {self.retry_after}',
+                         'parameters': {'retry_after': self.retry_after}}
+        if random.random() < self.error_rate:
+            return 500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'}
+
+        self.sent += 1
+        return 200, {'ok': True, 'result': {'message_id': self.sent, 'chat': {'id': params.get('chat_id')},
+                                            'date': int(time.time()), 'text': params.get('text')}}
@@ -0,0 +1,193 @@
+import re
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.serializers import ValidationError
+
+from habits.cache import get_habit_scopes, invalidate
+from habits.models import Habits, get_next_run_at
+from habits.serializer import HabitsSerializer
+from users.importers import add_import_error, copy_rows, get_import_result
+from users.models import User
+
+HABIT_COLUMNS = ('owner', 'owner_email', 'place', 'time', 'action', 'is_pleasant_habit', 'periodicity', 'reward',
+                 'time_to_complete', 'is_public')
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'f', 'no', 'n')
+TIME_PATTERN = r'^([01]?\d|2[0-3]):[0-5]\d(:[0-5]\d)?$'
+NUMBER_PATTERN = r'^\d{1,9}$'
+
+
+def import_habits(rows, batch_size=5000, max_errors=100):
+    """
+    Импорт привычек. Владелец указывается id (owner) или почтой (owner_email),
+    строки проверяются по тем же правилам, что и в HabitsSerializer, ошибочные строки пропускаются.
+    Связанные привычки не импортируются: их id в исходных данных не совпадают с id в базе
+    """
+    if connection.vendor == 'postgresql':
+        return _import_habits_copy(rows, max_errors)
+    return _import_habits_bulk(rows, batch_size, max_errors)
+
+
+def _import_habits_copy(rows, max_errors):
+    """
+    COPY во временную таблицу, проверка и перенос в habits_habits набором SQL запросов
+    """
+    result = get_import_result()
+    params = {
+        'time': TIME_PATTERN,
+        'number': NUMBER_PATTERN,
+        'true': list(TRUE_VALUES),
+        'bool': list(TRUE_VALUES + FALSE_VALUES),
+        'now': timezone.now(),
+        'tz': timezone.get_current_timezone_name(),
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'''
+            CREATE TEMP TABLE habits_import (
+                line bigint, {", ".join(f"{column} text" for column in HABIT_COLUMNS)}, owner_id bigint, error text
+            ) ON COMMIT DROP
+        ''')
+        copy_rows(cursor, 'habits_import', ('line', *HABIT_COLUMNS), rows)
+        cursor.execute('''
+            UPDATE habits_import i SET owner_id = u.id FROM users_user u
+            WHERE i.owner ~ %(number)s AND u.id = i.owner::bigint;
+            UPDATE habits_import i SET owner_id = u.id FROM users_user u
+            WHERE i.owner_id IS NULL AND u.email = trim(i.owner_email);
+            UPDATE habits_import SET is_pleasant_habit = lower(coalesce(is_pleasant_habit, 'true')),
+                                     is_public = lower(coalesce(is_public, 'true')),
+                                     periodicity = coalesce(periodicity, '1');
+            UPDATE habits_import SET error = CASE
+                WHEN owner_id IS NULL THEN 'владелец не найден'
+                WHEN place IS NULL OR length(place) > 200 THEN 'некорректное место'
+                WHEN action IS NULL OR length(action) > 300 THEN 'некорректное действие'
+                WHEN length(reward) > 100 THEN 'слишком длинное вознаграждение'
+                WHEN time IS NULL OR time !~ %(time)s THEN 'некорректное время'
+                WHEN time_to_complete IS NULL OR time_to_complete !~ %(number)s
+                    THEN 'некорректное время на выполнение'
+                WHEN periodicity !~ %(number)s THEN 'некорректная периодичность'
+                WHEN is_pleasant_habit <> ALL(%(bool)s) OR is_public <> ALL(%(bool)s) THEN 'некорректный признак'
+                -- правила habits.validators
+                WHEN time_to_complete::int > 120 THEN 'Время выполнения должно быть не больше 120 секунд'
+                WHEN periodicity::int NOT BETWEEN 1 AND 7 THEN 'Нельзя выполнять привычку реже, чем 1 раз в 7 дней'
+                WHEN is_pleasant_habit = ANY(%(true)s) AND reward IS NOT NULL
+                    THEN 'У приятной привычки не может быть вознаграждения или связанной привычки'
+            END;
+        ''', params)
+        cursor.execute('''
+            INSERT INTO habits_habits (owner_id, place, time, action, is_pleasant_habit, periodicity, reward,
+                                       time_to_complete, is_public, next_run_at, updated_at, current_streak,
+                                       best_streak, total_completions)
+            SELECT owner_id, place, time::time, action, is_pleasant_habit = ANY(%(true)s), periodicity::int, reward,
+                   time_to_complete::int, is_public = ANY(%(true)s),
+                   -- ближайшее наступление времени привычки, как в get_next_run_at
+                   CASE WHEN run_at > %(now)s THEN run_at ELSE run_at + interval '1 day' END,
+                   %(now)s, 0, 0, 0
+            FROM (
+                SELECT *, ((%(now)s AT TIME ZONE %(tz)s)::date + time::time) AT TIME ZONE %(tz)s AS run_at
+                FROM habits_import WHERE error IS NULL
+            ) AS valid
+        ''', params)
+        result['imported'] = cursor.rowcount
+        cursor.execute('SELECT owner_id, bool_or(is_public = ANY(%(true)s)) FROM habits_import WHERE error IS NULL '
+                       'GROUP BY owner_id', params)
+        owners = cursor.fetchall()
+        cursor.execute('SELECT count(*) FROM habits_import WHERE error IS NOT NULL')
+        result['skipped'] = cursor.fetchone()[0]
+        cursor.execute('SELECT line, error FROM habits_import WHERE error IS NOT NULL ORDER BY line LIMIT %s',
+                       [max_errors])
+        result['errors'] = cursor.fetchall()
+        scopes = {f'owner:{owner_id}' for owner_id, _ in owners}
+        if any(public for _, public in owners):
+            scopes.add('public')
+        invalidate(scopes)
+    return result
+
+
+def _import_habits_bulk(rows, batch_size, max_errors):
+    """
+    Проверка строк в Python и запись пачками через bulk_create
+    """
+    result = get_import_result()
+    batch = []
+
+    def flush():
+        owner_ids = {row['owner'] for row in batch if row['owner'] and re.match(NUMBER_PATTERN, row['owner'])}
+        emails = {row['owner_email'].strip() for row in batch if row['owner_email']}
+        by_id = set(User.objects.filter(id__in=owner_ids).values_list('id', flat=True))
+        by_email = dict(User.objects.filter(email__in=emails).values_list('email', 'id'))
+
+        habits = []
+        for row in batch:
+            owner_id = int(row['owner']) if row['owner'] in owner_ids else None
+            if owner_id not in by_id:
+                owner_id = by_email.get((row['owner_email'] or '').strip())
+            if owner_id is None:
+                add_import_error(result, row['line'], 'владелец не найден', max_errors)
+                continue
+            habits.append(Habits(owner_id=owner_id, next_run_at=get_next_run_at(row['attrs']['time']),
+                                 **row['attrs']))
+        Habits.objects.bulk_create(habits)
+        result['imported'] += len(habits)
+        invalidate(get_habit_scopes(habits))
+        batch.clear()
+
+    with transaction.atomic():
+        for row in rows:
+            row = {column: row.get(column) or None for column in ('line', *HABIT_COLUMNS)}
+            try:
+                row['attrs'] = _parse_habit(row)
+            except ValidationError as e:
+                add_import_error(result, row['line'], _error_text(e), max_errors)
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    return result
+
+
+def _parse_habit(row):
+    """
+    Значения строки в поля привычки с проверками HabitsSerializer
+    """
+    if not row['place'] or len(row['place']) > 200:
+        raise ValidationError('некорректное место')
+    if not row['action'] or len(row['action']) > 300:
+        raise ValidationError('некорректное действие')
+    if row['reward'] and len(row['reward']) > 100:
+        raise ValidationError('слишком длинное вознаграждение')
+    if not row['time'] or not re.match(TIME_PATTERN, row['time']):
+        raise ValidationError('некорректное время')
+    if not row['time_to_complete'] or not re.match(NUMBER_PATTERN, row['time_to_complete']):
+        raise ValidationError('некорректное время на выполнение')
+    periodicity = row['periodicity'] or '1'
+    if not re.match(NUMBER_PATTERN, periodicity):
+        raise ValidationError('некорректная периодичность')
+
+    flags = {}
+    for name in ('is_pleasant_habit', 'is_public'):
+        value = (row[name] or 'true').lower()
+        if value not in TRUE_VALUES + FALSE_VALUES:
+            raise ValidationError('некорректный признак')
+        flags[name] = value in TRUE_VALUES
+
+    attrs = {
+        'place': row['place'],
+        'time': row['time'] if row['time'].count(':') == 2 else f'{row["time"]}:00',
+        'action': row['action'],
+        'periodicity': int(periodicity),
+        'reward': row['reward'],
+        'time_to_complete': int(row['time_to_complete']),
+        'related_habit': None,
+        **flags,
+    }
+    for validator in HabitsSerializer.Meta.validators:
+        validator(attrs)
+    del attrs['related_habit']
+    return attrs
+
+
+def _error_text(error):
+    detail = error.detail
+    return str(detail[0] if isinstance(detail, list) else detail)
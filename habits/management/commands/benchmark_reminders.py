@@ -0,0 +1,119 @@
+import resource
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from habits import services, tasks
+from habits.fake_telegram import FakeTelegramServer
+from habits.models import Habits
+from users.models import User
+
+BENCH_DOMAIN = 'bench.local'
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест отправки напоминаний на локальной замене Telegram Bot API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--habits', type=int, default=10000, help='количество привычек')
+        parser.add_argument('--users', type=int, default=0, help='количество пользователей, по умолчанию habits / 5')
+        parser.add_argument('--latency', type=float, default=0, help='задержка ответа API, мс')
+        parser.add_argument('--rate-limit-rate', type=float, default=0, help='доля ответов 429')
+        parser.add_argument('--error-rate', type=float, default=0, help='доля ответов 500')
+        parser.add_argument('--global-rate', type=float, default=0, help='TELEGRAM_GLOBAL_RATE, 0 - без ограничения')
+        parser.add_argument('--chat-rate', type=float, default=0, help='TELEGRAM_CHAT_RATE, 0 - без ограничения')
+        parser.add_argument('--keep', action='store_true', help='не удалять созданные данные')
+
+    def handle(self, *args, **options):
+        habits_count = options['habits']
+        users_count = options['users'] or max(habits_count // 5, 1)
+        self.clear()
+        self.seed(users_count, habits_count)
+
+        server = FakeTelegramServer(latency=options['latency'] / 1000, rate_limit_rate=options['rate_limit_rate'],
+                                    error_rate=options['error_rate'], retry_after=0).start_process()
+        latencies = []
+        queries = []
+        try:
+            with self.patch_sender(server, latencies), override_settings(
+                    TELEGRAM_GLOBAL_RATE=options['global_rate'], TELEGRAM_CHAT_RATE=options['chat_rate'],
+                    OUTBOX_RETRY_DELAY=0), connection.execute_wrapper(self.count_queries(queries)):
+                started = time.monotonic()
+                totals = self.run_beat()
+                elapsed = time.monotonic() - started
+        finally:
+            server.stop()
+            if not options['keep']:
+                self.clear()
+
+        latencies.sort()
+        self.stdout.write(f'Привычек: {habits_count}, пользователей: {users_count}')
+        self.stdout.write(f'Результат: {totals}')
+        self.stdout.write(f'Время: {elapsed:.2f} с, сообщений в секунду: {totals["sent"] / elapsed:.0f}')
+        if latencies:
+            self.stdout.write(f'Задержка отправки: p50 {statistics.median(latencies) * 1000:.1f} мс, '
+                              f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} мс')
+        self.stdout.write(f'Запросов к БД: {len(queries)}')
+        self.stdout.write(f'Пиковое потребление памяти: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} МБ')
+
+    def seed(self, users_count, habits_count):
+        users = User.objects.bulk_create(
+            [User(email=f'user{i}@{BENCH_DOMAIN}', telegram_id=str(10 ** 6 + i), telegram_nik=f'bench{i}')
+             for i in range(users_count)],
+            batch_size=1000,
+        )
+        if users[0].pk is None:
+            users = list(User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}').order_by('id'))
+        due = timezone.now() - timedelta(minutes=1)
+        Habits.objects.bulk_create(
+            [Habits(owner=users[i % users_count], place='Парк', time=due.time(), action='Бег', time_to_complete=30,
+                    next_run_at=due, is_public=False)
+             for i in range(habits_count)],
+            batch_size=1000,
+        )
+
+    def clear(self):
+        User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}').delete()
+
+    def run_beat(self):
+        """
+        Полный цикл отправки без брокера: планирование и последовательная обработка всех подзадач
+        """
+        now = timezone.now()
+        results = [tasks.send_tg_chunk(first_id, last_id, now.isoformat())
+                   for first_id, last_id in tasks.get_due_chunks(now, settings.REMINDER_CHUNK_SIZE)]
+        return tasks.sum_chunk_results(results)
+
+    @contextmanager
+    def patch_sender(self, server, latencies):
+        """
+        Направляет отправку на локальный сервер и собирает задержки отправленных сообщений
+        """
+        url, token, send_messages = services.URL, services.TOKEN, tasks.send_messages
+
+        def recording_send_messages(messages):
+            results = send_messages(messages)
+            latencies.extend(result['latency'] for result in results if result['latency'] is not None)
+            return results
+
+        services.URL, services.TOKEN = server.url, 'bench'
+        tasks.send_messages = recording_send_messages
+        try:
+            yield
+        finally:
+            services.URL, services.TOKEN = url, token
+            tasks.send_messages = send_messages
+
+    @staticmethod
+    def count_queries(queries):
+        def wrapper(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+        return wrapper
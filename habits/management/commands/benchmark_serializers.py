@@ -0,0 +1,35 @@
+import timeit
+from datetime import time, timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from habits.models import Habits
+from habits.serializer import HabitsReadSerializer, HabitsSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнение скорости сериализации страницы привычек HabitsSerializer и HabitsReadSerializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help='привычек на странице')
+        parser.add_argument('--repeat', type=int, default=200, help='количество повторов')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        habits = [
+            Habits(id=i, owner_id=i % 10 + 1, place='Park', time=time(7, i % 60), action=f'Action {i}',
+                   is_pleasant_habit=False, related_habit_id=None, periodicity=1, reward='Ice cream',
+                   time_to_complete=30, is_public=True, next_run_at=now + timedelta(minutes=i), updated_at=now)
+            for i in range(1, options['page_size'] + 1)
+        ]
+        serializers = {
+            'HabitsSerializer': lambda: HabitsSerializer(habits, many=True).data,
+            'HabitsReadSerializer': lambda: HabitsReadSerializer(habits, many=True).data,
+            'HabitsReadSerializer(fields=id,action,time)': lambda: HabitsReadSerializer(
+                habits, many=True, fields=('id', 'action', 'time')).data,
+        }
+        self.stdout.write(f'Привычек на странице: {options["page_size"]}, повторов: {options["repeat"]}')
+        for name, serialize in serializers.items():
+            elapsed = timeit.timeit(serialize, number=options['repeat']) / options['repeat']
+            self.stdout.write(f'{name}: {elapsed * 1000:.2f} мс на страницу')
@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from habits.fake_telegram import FakeTelegramServer
+
+
+class Command(BaseCommand):
+    help = 'Запуск локальной замены Telegram Bot API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--latency', type=float, default=0, help='задержка ответа, мс')
+        parser.add_argument('--rate-limit-rate', type=float, default=0, help='доля ответов 429')
+        parser.add_argument('--error-rate', type=float, default=0, help='доля ответов 500')
+        parser.add_argument('--retry-after', type=int, default=1, help='retry_after в ответах 429, секунд')
+
+    def handle(self, *args, **options):
+        server = FakeTelegramServer(options['host'], options['port'], latency=options['latency'] / 1000,
+                                    rate_limit_rate=options['rate_limit_rate'], error_rate=options['error_rate'],
+                                    retry_after=options['retry_after'])
+        try:
+            server.serve_forever(lambda port: self.stdout.write(f'TELEGRAM_URL={server.url} (любой TOKEN_BOT)'))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,22 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from config.schema import generate_schema
+
+
+class Command(BaseCommand):
+    help = 'Генерация OpenAPI схемы в файл, который отдает /swagger.json'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.OPENAPI_SCHEMA_PATH, help='файл схемы')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        content = generate_schema()
+        # запись через временный файл: запущенные процессы не прочитают схему наполовину
+        temp_path = path.with_name(f'{path.name}.tmp')
+        temp_path.write_bytes(content)
+        temp_path.replace(path)
+        self.stdout.write(f'Схема записана в {path}, {len(content)} байт')
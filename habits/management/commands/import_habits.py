@@ -0,0 +1,21 @@
+import time
+
+from django.core.management import BaseCommand
+
+from habits.importers import import_habits
+from users.importers import read_rows, write_import_result
+
+
+class Command(BaseCommand):
+    help = ('Импорт привычек из CSV или NDJSON. В PostgreSQL данные загружаются через COPY '
+            'и проверяются SQL запросами, в других базах - пачками через bulk_create')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл .csv, .ndjson или .jsonl, можно сжатый .gz')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='формат файла, по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=5000, help='размер пачки для bulk_create')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        result = import_habits(read_rows(options['path'], options['format']), batch_size=options['batch_size'])
+        write_import_result(self, result, time.monotonic() - started)
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from habits.tasks import TelegramAPIError, poll_updates
+
+# пауза после ошибки удваивается, пока опрос не пройдет успешно
+BACKOFF_MIN = 1
+BACKOFF_MAX = 60
+
+
+class Command(BaseCommand):
+    help = 'Получение обновлений Telegram через long polling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='выполнить один цикл опроса и завершиться')
+
+    def handle(self, *args, **options):
+        backoff = BACKOFF_MIN
+        while True:
+            try:
+                received = poll_updates(settings.TELEGRAM_POLL_TIMEOUT)
+            except Exception as e:
+                if options['once']:
+                    raise
+                # при 429 Telegram сообщает, сколько ждать
+                delay = e.retry_after if isinstance(e, TelegramAPIError) and e.retry_after else backoff
+                self.stderr.write(f'Ошибка получения обновлений: {e!r}, повтор через {delay} с')
+                time.sleep(delay)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                continue
+            backoff = BACKOFF_MIN
+            if options['once']:
+                self.stdout.write(f'Получено обновлений: {received}')
+                return
@@ -0,0 +1,101 @@
+import glob
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+logger = logging.getLogger('habits.metrics')
+
+TASK_DURATION = Histogram('habits_task_duration_seconds', 'Длительность задач отправки напоминаний', ['task'],
+                          buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+TASK_DB_TIME = Histogram('habits_task_db_seconds', 'Время запросов к БД в задачах отправки напоминаний', ['task'],
+                         buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60))
+DUE_HABITS = Histogram('habits_due_habits', 'Количество привычек с наступившим временем в подзадаче',
+                       buckets=(0, 10, 100, 500, 1000, 5000, 10000, 50000))
+NOTIFICATIONS = Counter('habits_notifications_total', 'Напоминания по результату', ['result'])
+SEND_LATENCY = Histogram('habits_telegram_send_seconds', 'Длительность запроса sendMessage',
+                         buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+SEND_RETRIES = Counter('habits_telegram_retries_total', 'Повторные запросы sendMessage')
+QUEUE_LAG = Histogram('habits_notification_lag_seconds', 'Задержка отправки напоминания относительно расписания',
+                      buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+
+
+@contextmanager
+def track_task(task):
+    """
+    Замеряет длительность задачи и время запросов к БД внутри нее.
+    Счетчики, добавленные в возвращаемый словарь, попадают в структурированную строку лога
+    """
+    stats = {}
+    db = {'time': 0, 'queries': 0}
+
+    def timer(execute, sql, params, many, context):
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            db['time'] += time.monotonic() - started
+            db['queries'] += 1
+
+    started = time.monotonic()
+    try:
+        with connection.execute_wrapper(timer):
+            yield stats
+    finally:
+        duration = time.monotonic() - started
+        TASK_DURATION.labels(task).observe(duration)
+        TASK_DB_TIME.labels(task).observe(db['time'])
+        logger.info(json.dumps({'task': task, 'duration': round(duration, 3), 'db_time': round(db['time'], 3),
+                                'db_queries': db['queries'], **stats}, ensure_ascii=False))
+
+
+def observe_send_results(results):
+    for result in results:
+        if result.get('latency') is not None:
+            SEND_LATENCY.observe(result['latency'])
+        if result.get('retries'):
+            SEND_RETRIES.inc(result['retries'])
+
+
+class MultiDirectoryCollector:
+    """
+    Метрики процессов из каталогов всех контейнеров: у каждого контейнера свой
+    PROMETHEUS_MULTIPROC_DIR внутри общего PROMETHEUS_METRICS_DIR, потому что файлы
+    prometheus_client называются по PID, а PID в разных контейнерах совпадают
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def collect(self):
+        files = glob.glob(os.path.join(self.path, '*', '*.db'))
+        return multiprocess.MultiProcessCollector.merge(files, accumulate=True)
+
+
+def render_metrics():
+    """
+    Метрики в формате Prometheus. Если задан PROMETHEUS_METRICS_DIR или PROMETHEUS_MULTIPROC_DIR,
+    собираются метрики всех процессов (веб-сервер и воркеры Celery)
+    """
+    if 'PROMETHEUS_METRICS_DIR' in os.environ:
+        registry = CollectorRegistry()
+        registry.register(MultiDirectoryCollector(os.environ['PROMETHEUS_METRICS_DIR']))
+    elif 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid=None):
+    """
+    Удаляет файлы живых gauge завершившегося процесса, счетчики и гистограммы сохраняются
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
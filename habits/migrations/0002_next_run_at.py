@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+def fill_next_run_at(apps, schema_editor):
+    from habits.models import get_next_run_at
+
+    Habits = apps.get_model('habits', 'Habits')
+    batch = []
+    for habit in Habits.objects.filter(next_run_at__isnull=True).only('id', 'time').iterator(chunk_size=2000):
+        habit.next_run_at = get_next_run_at(habit.time)
+        batch.append(habit)
+        if len(batch) >= 2000:
+            Habits.objects.bulk_update(batch, ['next_run_at'])
+            batch = []
+    Habits.objects.bulk_update(batch, ['next_run_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habits',
+            name='next_run_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='время следующего напоминания'),
+        ),
+        migrations.RunPython(fill_next_run_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0002_next_run_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramOffset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('update_id', models.BigIntegerField(default=0, verbose_name='id последнего обновления')),
+            ],
+            options={
+                'verbose_name': 'Смещение обновлений Telegram',
+                'verbose_name_plural': 'Смещения обновлений Telegram',
+            },
+        ),
+        migrations.CreateModel(
+            name='TelegramUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('update_id', models.BigIntegerField(unique=True, verbose_name='id обновления')),
+                ('payload', models.JSONField(verbose_name='данные обновления')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='время получения')),
+            ],
+            options={
+                'verbose_name': 'Обновление Telegram',
+                'verbose_name_plural': 'Обновления Telegram',
+            },
+        ),
+    ]
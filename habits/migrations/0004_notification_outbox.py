@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0003_telegram_updates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.CharField(max_length=50, verbose_name='чат')),
+                ('text', models.TextField(verbose_name='текст')),
+                ('scheduled_for', models.DateTimeField(verbose_name='запланированное время')),
+                ('status', models.CharField(choices=[('pending', 'ожидает отправки'), ('sent', 'отправлено'), ('dead', 'не удалось отправить')], default='pending', max_length=10, verbose_name='статус')),
+                ('attempts', models.IntegerField(default=0, verbose_name='количество попыток')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='время следующей попытки')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='последняя ошибка')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='время отправки')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='habits.habits', verbose_name='привычка')),
+            ],
+            options={
+                'verbose_name': 'Напоминание',
+                'verbose_name_plural': 'Напоминания',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='habits_noti_status_9e17f0_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notificationoutbox',
+            constraint=models.UniqueConstraint(fields=('habit', 'scheduled_for'), name='unique_habit_notification'),
+        ),
+    ]
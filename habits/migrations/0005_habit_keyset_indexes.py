@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0004_notification_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habits',
+            index=models.Index(fields=['owner', 'id'], name='habits_habi_owner_i_6286fc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habits',
+            index=models.Index(fields=['is_public', 'id'], name='habits_habi_is_publ_d49de6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habits',
+            index=models.Index(fields=['is_public', 'time', 'id'], name='habits_habi_is_publ_cd28e1_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0005_habit_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habits',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='время изменения'),
+        ),
+        migrations.AddIndex(
+            model_name='habits',
+            index=models.Index(fields=['owner', 'updated_at'], name='habits_habi_owner_i_727544_idx'),
+        ),
+    ]
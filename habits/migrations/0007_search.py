@@ -0,0 +1,64 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:19
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR = ("setweight(to_tsvector('russian', coalesce({0}action, '')), 'A') || "
+                 "setweight(to_tsvector('russian', coalesce({0}place, '')), 'B')")
+
+CREATE_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f"""
+    CREATE OR REPLACE FUNCTION habits_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {SEARCH_VECTOR.format('NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER habits_search_vector_trigger BEFORE INSERT OR UPDATE OF action, place ON habits_habits
+    FOR EACH ROW EXECUTE FUNCTION habits_search_vector_update()
+    """,
+    f'UPDATE habits_habits SET search_vector = {SEARCH_VECTOR.format("")}',
+    'CREATE INDEX habits_search_vector_idx ON habits_habits USING gin (search_vector)',
+    'CREATE INDEX habits_action_trgm_idx ON habits_habits USING gin (action gin_trgm_ops)',
+    'CREATE INDEX habits_place_trgm_idx ON habits_habits USING gin (place gin_trgm_ops)',
+]
+
+DROP_SQL = [
+    'DROP INDEX IF EXISTS habits_place_trgm_idx',
+    'DROP INDEX IF EXISTS habits_action_trgm_idx',
+    'DROP INDEX IF EXISTS habits_search_vector_idx',
+    'DROP TRIGGER IF EXISTS habits_search_vector_trigger ON habits_habits',
+    'DROP FUNCTION IF EXISTS habits_search_vector_update()',
+]
+
+
+def run_postgresql(statements):
+    """
+    Триггер и GIN индексы есть только в PostgreSQL, на других базах поиск работает через icontains
+    """
+
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for sql in statements:
+                schema_editor.execute(sql)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0006_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habits',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True, verbose_name='поисковый вектор'),
+        ),
+        migrations.RunPython(run_postgresql(CREATE_SQL), run_postgresql(DROP_SQL)),
+    ]
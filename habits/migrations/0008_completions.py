@@ -0,0 +1,87 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+CREATE_SQL = [
+    # первичный ключ и уникальность секционированной таблицы должны включать ключ секционирования
+    """
+    CREATE TABLE habits_habitcompletion (
+        id bigint GENERATED BY DEFAULT AS IDENTITY,
+        completed_on date NOT NULL,
+        created_at timestamp with time zone NOT NULL,
+        habit_id bigint NOT NULL REFERENCES habits_habits (id) DEFERRABLE INITIALLY DEFERRED,
+        PRIMARY KEY (id, completed_on),
+        CONSTRAINT unique_habit_completion UNIQUE (habit_id, completed_on)
+    ) PARTITION BY RANGE (completed_on)
+    """,
+    'CREATE TABLE habits_habitcompletion_default PARTITION OF habits_habitcompletion DEFAULT',
+]
+
+
+class CreatePartitionedModel(migrations.CreateModel):
+    """
+    В PostgreSQL таблица выполнений создается секционированной по месяцам completed_on,
+    на других базах - обычной таблицей
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        from habits.completions import create_partitions
+
+        for sql in CREATE_SQL:
+            schema_editor.execute(sql)
+        with schema_editor.connection.cursor() as cursor:
+            create_partitions(cursor, timezone.localdate(), settings.HABITS_COMPLETION_PARTITIONS_AHEAD)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        schema_editor.execute('DROP TABLE habits_habitcompletion CASCADE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0007_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habits',
+            name='best_streak',
+            field=models.IntegerField(default=0, verbose_name='лучшая серия выполнений'),
+        ),
+        migrations.AddField(
+            model_name='habits',
+            name='current_streak',
+            field=models.IntegerField(default=0, verbose_name='текущая серия выполнений'),
+        ),
+        migrations.AddField(
+            model_name='habits',
+            name='last_completed_on',
+            field=models.DateField(blank=True, null=True, verbose_name='дата последнего выполнения'),
+        ),
+        migrations.AddField(
+            model_name='habits',
+            name='total_completions',
+            field=models.IntegerField(default=0, verbose_name='всего выполнений'),
+        ),
+        CreatePartitionedModel(
+            name='HabitCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_on', models.DateField(verbose_name='дата выполнения')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='время отметки')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='habits.habits', verbose_name='привычка')),
+            ],
+            options={
+                'verbose_name': 'Выполнение привычки',
+                'verbose_name_plural': 'Выполнения привычек',
+                'constraints': [models.UniqueConstraint(fields=('habit', 'completed_on'), name='unique_habit_completion')],
+            },
+        ),
+    ]
@@ -1,5 +1,10 @@
+from datetime import datetime, timedelta
+
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_time
 
 from users.models import NULLABLE
 
@@ -15,6 +20,30 @@ class Habits(models.Model):
     reward = models.CharField(max_length=100, null=True, blank=True, verbose_name='вознаграждение')
     time_to_complete = models.IntegerField(verbose_name='время на выполнение')
     is_public = models.BooleanField(default=True, verbose_name='признак публичности')
+    next_run_at = models.DateTimeField(db_index=True, verbose_name='время следующего напоминания', **NULLABLE)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='время изменения')
+    # заполняется триггером PostgreSQL из action и place, см. миграцию 0007_search
+    search_vector = SearchVectorField(editable=False, verbose_name='поисковый вектор', **NULLABLE)
+    # счетчики выполнения обновляются вместе с записью HabitCompletion, см. habits.completions
+    current_streak = models.IntegerField(default=0, verbose_name='текущая серия выполнений')
+    best_streak = models.IntegerField(default=0, verbose_name='лучшая серия выполнений')
+    total_completions = models.IntegerField(default=0, verbose_name='всего выполнений')
+    last_completed_on = models.DateField(verbose_name='дата последнего выполнения', **NULLABLE)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        habit = super().from_db(db, field_names, values)
+        # публичность при загрузке: снятие признака тоже меняет публичный список, см. get_habit_scopes
+        habit.was_public = habit.__dict__.get('is_public')
+        return habit
+
+    def save(self, *args, **kwargs):
+        if self.next_run_at is None:
+            self.next_run_at = get_next_run_at(self.time)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'next_run_at'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'Я буду {self.action} в {self.time} в {self.place}'
@@ -22,3 +51,113 @@ class Habits(models.Model):
     class Meta:
         verbose_name = "Привычка"
         verbose_name_plural = "Привычки"
+        indexes = [
+            models.Index(fields=['owner', 'id']),
+            models.Index(fields=['is_public', 'id']),
+            models.Index(fields=['is_public', 'time', 'id']),
+            models.Index(fields=['owner', 'updated_at']),
+        ]
+
+
+class HabitCompletion(models.Model):
+    """
+    Отметка о выполнении привычки за день.
+    В PostgreSQL таблица секционирована по месяцам completed_on, см. миграцию 0008_completions
+    """
+    habit = models.ForeignKey(Habits, on_delete=models.CASCADE, related_name='completions', verbose_name='привычка')
+    completed_on = models.DateField(verbose_name='дата выполнения')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='время отметки')
+
+    class Meta:
+        verbose_name = "Выполнение привычки"
+        verbose_name_plural = "Выполнения привычек"
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'completed_on'], name='unique_habit_completion'),
+        ]
+
+
+class NotificationOutbox(models.Model):
+    """
+    Напоминание о привычке, ожидающее отправки в Telegram
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'ожидает отправки'),
+        (STATUS_SENT, 'отправлено'),
+        (STATUS_DEAD, 'не удалось отправить'),
+    ]
+
+    habit = models.ForeignKey(Habits, on_delete=models.CASCADE, related_name='notifications', verbose_name='привычка')
+    chat_id = models.CharField(max_length=50, verbose_name='чат')
+    text = models.TextField(verbose_name='текст')
+    scheduled_for = models.DateTimeField(verbose_name='запланированное время')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='статус')
+    attempts = models.IntegerField(default=0, verbose_name='количество попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='время следующей попытки')
+    last_error = models.TextField(verbose_name='последняя ошибка', **NULLABLE)
+    sent_at = models.DateTimeField(verbose_name='время отправки', **NULLABLE)
+
+    class Meta:
+        verbose_name = "Напоминание"
+        verbose_name_plural = "Напоминания"
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'scheduled_for'], name='unique_habit_notification'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+
+class TelegramUpdate(models.Model):
+    """
+    Входящее обновление Telegram, ожидающее обработки
+    """
+    update_id = models.BigIntegerField(unique=True, verbose_name='id обновления')
+    payload = models.JSONField(verbose_name='данные обновления')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='время получения')
+
+    class Meta:
+        verbose_name = "Обновление Telegram"
+        verbose_name_plural = "Обновления Telegram"
+
+
+class TelegramOffset(models.Model):
+    """
+    Последнее полученное через getUpdates обновление
+    """
+    update_id = models.BigIntegerField(default=0, verbose_name='id последнего обновления')
+
+    @classmethod
+    def get(cls):
+        return cls.objects.get_or_create(pk=1)[0]
+
+    class Meta:
+        verbose_name = "Смещение обновлений Telegram"
+        verbose_name_plural = "Смещения обновлений Telegram"
+
+
+def get_next_run_at(habit_time, now=None):
+    """
+    Возвращает ближайший момент после now, когда наступает время привычки
+    """
+    if isinstance(habit_time, str):
+        habit_time = parse_time(habit_time)
+    now = now or timezone.now()
+    local_now = timezone.localtime(now)
+    run_at = timezone.make_aware(datetime.combine(local_now.date(), habit_time))
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    return run_at
+
+
+def advance_next_run_at(next_run_at, periodicity, now=None):
+    """
+    Сдвигает время напоминания на периодичность привычки, пока оно не окажется в будущем
+    """
+    now = now or timezone.now()
+    step = timedelta(days=max(periodicity, 1))
+    if next_run_at > now:
+        return next_run_at
+    return next_run_at + step * ((now - next_run_at) // step + 1)
@@ -1,7 +1,189 @@
-from rest_framework.pagination import PageNumberPagination
+import operator
+from functools import reduce
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_time
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor, PageNumberPagination
+
+
+class HabitCursorPagination(CursorPagination):
+    """
+    Пагинация по курсору (keyset): следующая страница выбирается условием по последней записи,
+    поэтому стоимость запроса не зависит от номера страницы и не требует COUNT(*).
+    Порядок задается параметром ordering: id (по умолчанию) или time (время, затем id)
+    """
+    page_size = 5
+    ordering_query_param = 'ordering'
+    orderings = {
+        'id': ('id',),
+        'time': ('time', 'id'),
+    }
+    # разбор значений позиции курсора по полям сортировки
+    position_parsers = {
+        'id': int,
+        'time': parse_time,
+    }
+
+    def get_ordering(self, request, queryset, view):
+        default = next(iter(self.orderings.values()))
+        return self.orderings.get(request.query_params.get(self.ordering_query_param), default)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Асинхронный вариант paginate_queryset для асинхронных представлений
+        """
+        return self.set_page([item async for item in self.get_page_queryset(queryset, request, view).aiterator()])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Запрос страницы: условие по позиции курсора и одна лишняя запись, чтобы узнать, есть ли следующая страница
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        if self.cursor and self.cursor.position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(self.cursor.position, reverse))
+        queryset = queryset.order_by(*(_reverse_field(field) if reverse else field for field in self.ordering))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        reverse = bool(self.cursor and self.cursor.reverse)
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        has_position = self.cursor is not None and self.cursor.position is not None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = has_position, has_more
+        else:
+            self.has_next, self.has_previous = has_more, has_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_keyset_filter(self, position, reverse):
+        """
+        Условие «после позиции» (или «до позиции» при обратном курсоре) по составному ключу сортировки:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        try:
+            values = position.split(',')
+            if len(values) != len(self.ordering):
+                raise ValueError
+            keys = []
+            for field, value in zip(self.ordering, values):
+                name = field.lstrip('-')
+                parsed = self.position_parsers[name](value)
+                if parsed is None:
+                    raise ValueError
+                keys.append((name, field.startswith('-') != reverse, parsed))
+        except (ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        conditions = []
+        for index, (name, descending, value) in enumerate(keys):
+            equal = {previous: previous_value for previous, _, previous_value in keys[:index]}
+            conditions.append(Q(**equal, **{f'{name}__{"lt" if descending else "gt"}': value}))
+        return reduce(operator.or_, conditions)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            value = getattr(instance, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else repr(value))
+        return ','.join(values)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False,
+                                         position=self._get_position_from_instance(self.page[-1], self.ordering)))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True,
+                                         position=self._get_position_from_instance(self.page[0], self.ordering)))
+
+
+class HabitSearchPagination(HabitCursorPagination):
+    """
+    Пагинация результатов поиска по убыванию релевантности
+    """
+    orderings = {
+        'rank': ('-rank', 'id'),
+    }
+    position_parsers = {
+        'id': int,
+        'rank': float,
+    }
+
+
+def _reverse_field(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
 
 
 class HabitPagination(PageNumberPagination):
+    """
+    Постраничная пагинация по номеру страницы. С параметром pagination=cursor
+    (или при переходе по ссылке с cursor) используется HabitCursorPagination
+    """
     page_size = 5
     page_query_param = 'page_size'
     max_page_size = 10
+    mode_query_param = 'pagination'
+    cursor_paginator = None
+
+    def is_cursor_mode(self, request):
+        return request.query_params.get(self.mode_query_param) == 'cursor' or 'cursor' in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_mode(request):
+            self.cursor_paginator = HabitCursorPagination()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Асинхронный вариант paginate_queryset: COUNT(*) и выборка страницы через асинхронный ORM
+        """
+        if self.is_cursor_mode(request):
+            self.cursor_paginator = HabitCursorPagination()
+            return await self.cursor_paginator.apaginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        # count у Paginator - cached_property, заранее посчитанное значение избавляет от синхронного запроса
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        bottom = (number - 1) * paginator.per_page
+        top = bottom + paginator.per_page
+        if top + paginator.orphans >= paginator.count:
+            top = paginator.count
+        results = [item async for item in queryset[bottom:top].aiterator()]
+        self.page = paginator._get_page(results, number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
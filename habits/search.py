@@ -0,0 +1,28 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast, Greatest
+
+# конфигурация полнотекстового поиска, та же, что в триггере из миграции 0007_search
+SEARCH_CONFIG = 'russian'
+
+
+def search_habits(queryset, text):
+    """
+    Поиск привычек по действию и месту с оценкой релевантности в аннотации rank.
+    В PostgreSQL используется полнотекстовый поиск по search_vector и триграммное сходство
+    для опечаток (оба по GIN индексам), на других базах - поиск подстроки
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.filter(Q(action__icontains=text) | Q(place__icontains=text)).annotate(
+            rank=Value(1.0, output_field=FloatField()))
+
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(
+        Q(search_vector=query) | Q(action__trigram_similar=text) | Q(place__trigram_similar=text)
+    ).annotate(
+        # ts_rank и similarity возвращают real. Курсор хранит rank как float Python (double),
+        # поэтому без приведения к double precision граничная запись не равна значению из курсора
+        rank=Cast(Greatest(SearchRank(F('search_vector'), query), TrigramSimilarity('action', text),
+                           TrigramSimilarity('place', text)), FloatField()),
+    )
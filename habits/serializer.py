@@ -1,13 +1,49 @@
+from operator import attrgetter
+
+from django.utils import timezone
 from rest_framework import serializers
-from habits.models import Habits
+from habits.cache import get_habit_scopes, invalidate
+from habits.models import Habits, get_next_run_at
 from habits.validators import TimeCompleteValidator, ChoiceValidator, RelatedPleasantValidator, PleasantValidator, \
     PeriodicityValidator
 
 
+class HabitsListSerializer(serializers.ListSerializer):
+    """
+    Пакетная запись привычек: один INSERT или UPDATE на всю пачку вместо запроса на каждую привычку.
+    bulk_create и bulk_update не вызывают save() и сигналы, поэтому расписание и кэш обновляются здесь
+    """
+
+    def create(self, validated_data):
+        habits = [Habits(**attrs) for attrs in validated_data]
+        for habit in habits:
+            habit.next_run_at = get_next_run_at(habit.time)
+        habits = Habits.objects.bulk_create(habits)
+        invalidate(get_habit_scopes(habits))
+        return habits
+
+    def update(self, instance, validated_data):
+        now = timezone.now()
+        fields = {'updated_at'}
+        for habit, attrs in zip(instance, validated_data):
+            if 'time' in attrs and attrs['time'] != habit.time:
+                habit.next_run_at = get_next_run_at(attrs['time'])
+                fields.add('next_run_at')
+            for attr, value in attrs.items():
+                setattr(habit, attr, value)
+            fields.update(attrs)
+            habit.updated_at = now
+        Habits.objects.bulk_update(instance, fields)
+        invalidate(get_habit_scopes(instance))
+        return instance
+
+
 class HabitsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Habits
-        fields = '__all__'
+        exclude = ['search_vector']
+        read_only_fields = ['next_run_at', 'current_streak', 'best_streak', 'total_completions', 'last_completed_on']
+        list_serializer_class = HabitsListSerializer
         validators = [
             TimeCompleteValidator(field='time_to_complete'),
             ChoiceValidator(field1='related_habit', field2='reward'),
@@ -15,3 +51,140 @@ class HabitsSerializer(serializers.ModelSerializer):
             PleasantValidator(field1='is_pleasant_habit', field2='reward', field3='related_habit'),
             PeriodicityValidator(field='periodicity')
         ]
+
+    def update(self, instance, validated_data):
+        if 'time' in validated_data and validated_data['time'] != instance.time:
+            # время привычки изменилось - расписание напоминаний пересчитывается при сохранении
+            instance.next_run_at = None
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # UPDATE только переданных полей, next_run_at при пересчете добавляет Habits.save
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
+
+
+class HabitIdField(serializers.PrimaryKeyRelatedField):
+    """
+    id связанной привычки без запроса к базе на каждое значение,
+    привычки загружает одним запросом HabitsBulkListSerializer.validate
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class HabitsBulkListSerializer(HabitsListSerializer):
+    """
+    Пакетная запись привычек с числом запросов, не зависящим от размера пачки
+    """
+
+    def run_child_validation(self, data):
+        # при изменении каждая привычка проверяется вместе со своим экземпляром, см. HabitsBulkSerializer
+        if self.instance is not None:
+            self.child.instance = {habit.pk: habit for habit in self.instance}.get(data.get('id'))
+        return super().run_child_validation(data)
+
+    def validate(self, attrs):
+        ids = {item['related_habit'] for item in attrs if item.get('related_habit')}
+        related = Habits.objects.only('id').in_bulk(ids) if ids else {}
+        not_found = sorted(ids - set(related))
+        if not_found:
+            message = self.child.fields['related_habit'].error_messages['does_not_exist']
+            raise serializers.ValidationError({'related_habit': [message.format(pk_value=pk) for pk in not_found]})
+        for item in attrs:
+            if item.get('related_habit'):
+                item['related_habit'] = related[item['related_habit']]
+        return attrs
+
+
+class HabitsBulkSerializer(HabitsSerializer):
+    """
+    Привычка в пакетном запросе. Владелец не передается клиентом, а задается при сохранении.
+    При изменении записываются только переданные поля, а проверки видят привычку целиком
+    """
+    related_habit = HabitIdField(queryset=Habits.objects.all(), allow_null=True, required=False)
+
+    class Meta(HabitsSerializer.Meta):
+        read_only_fields = [*HabitsSerializer.Meta.read_only_fields, 'owner']
+        list_serializer_class = HabitsBulkListSerializer
+
+    def run_validators(self, value):
+        if self.instance is not None:
+            habit = self.instance
+            value = {'related_habit': habit.related_habit_id, 'reward': habit.reward,
+                     'is_pleasant_habit': habit.is_pleasant_habit, 'time_to_complete': habit.time_to_complete,
+                     'periodicity': habit.periodicity, **value}
+        super().run_validators(value)
+
+
+class HabitCompletionSerializer(serializers.Serializer):
+    """
+    Отметка выполнения привычки: дата по умолчанию - сегодня, будущие даты не принимаются
+    """
+    completed_on = serializers.DateField(required=False)
+
+    def validate_completed_on(self, value):
+        if value > timezone.localdate():
+            raise serializers.ValidationError('Нельзя отметить выполнение в будущем')
+        return value
+
+
+HABIT_FIELDS = ('id', 'owner', 'place', 'time', 'action', 'is_pleasant_habit', 'related_habit', 'periodicity',
+                'reward', 'time_to_complete', 'is_public', 'next_run_at', 'updated_at', 'current_streak', 'best_streak',
+                'total_completions', 'last_completed_on')
+EXPANDABLE_FIELDS = ('related_habit',)
+
+
+class HabitsReadSerializer(serializers.BaseSerializer):
+    """
+    Быстрый сериализатор только для чтения списков привычек.
+    Формирует тот же ответ, что и HabitsSerializer, но без обхода полей DRF для каждой записи.
+    fields - выводимые поля (по умолчанию все), expand - связи, выводимые вложенным объектом,
+    can_expand - проверка, можно ли показать связанную привычку; иначе выводится только ее id
+    """
+
+    def __init__(self, *args, fields=None, expand=(), can_expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.habit_fields = fields or HABIT_FIELDS
+        self.can_expand = can_expand
+        # часовой пояс определяется один раз на запрос, а не для каждого значения, как в DateTimeField
+        self.timezone = timezone.get_current_timezone()
+        self.getters = [(field, self.get_getter(field, expand)) for field in self.habit_fields]
+
+    def get_getter(self, field, expand):
+        if field == 'owner':
+            return attrgetter('owner_id')
+        if field == 'related_habit' and field in expand:
+            related = HabitsReadSerializer(fields=self.habit_fields)
+            can_expand = self.can_expand or (lambda related_habit: True)
+            return lambda habit: habit.related_habit_id and (
+                related.to_representation(habit.related_habit) if can_expand(habit.related_habit)
+                else habit.related_habit_id
+            )
+        if field == 'related_habit':
+            return attrgetter('related_habit_id')
+        if field == 'time':
+            return lambda habit: habit.time.isoformat()
+        if field == 'last_completed_on':
+            return lambda habit: habit.last_completed_on and habit.last_completed_on.isoformat()
+        if field in ('next_run_at', 'updated_at'):
+            getter = attrgetter(field)
+            return lambda habit: self.format_datetime(getter(habit))
+        return attrgetter(field)
+
+    def format_datetime(self, value):
+        """
+        Дата и время в формате DateTimeField из DRF
+        """
+        if value is None:
+            return None
+        value = value.astimezone(self.timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    def to_representation(self, habit):
+        return {field: getter(habit) for field, getter in self.getters}
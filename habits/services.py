@@ -1,9 +1,15 @@
+import asyncio
+import time
+
+import aiohttp
 import requests
 from django.conf import settings
 
 URL = settings.TELEGRAM_URL
 TOKEN = settings.TOKEN_BOT
 
+session = requests.Session()
+
 
 def send_message(text, chat_id):
     """
@@ -14,6 +20,127 @@ def send_message(text, chat_id):
         'chat_id': chat_id,
         'text': text
     }
-    requests.post(url, data=payload)
-    # response = requests.post(url, data=payload)
-    # return response.json()
+
+    response = session.post(url, data=payload, timeout=settings.TELEGRAM_TIMEOUT)
+    return response.json()
+
+
+def send_messages(messages):
+    """
+    Отправляет пачку сообщений через Telegram бот.
+    messages - последовательность словарей с ключами chat_id и text.
+    Возвращает результаты в том же порядке, что и сообщения
+    """
+    return asyncio.run(TelegramSender().send_all(list(messages)))
+
+
+class TokenBucket:
+    """
+    Ограничение частоты запросов алгоритмом token bucket.
+    rate - количество запросов в секунду, 0 - без ограничения
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def take(self):
+        """
+        Забирает токен, если он есть. Иначе возвращает время ожидания в секундах
+        """
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while (delay := self.take()) > 0:
+            await asyncio.sleep(delay)
+
+
+class TelegramSender:
+    """
+    Конкурентная отправка сообщений с общим пулом соединений,
+    ограничением частоты (общим и для каждого чата) и обработкой ответа 429
+    """
+
+    def __init__(self, concurrency=None, global_rate=None, chat_rate=None, max_retries=None):
+        self.concurrency = concurrency or settings.TELEGRAM_CONCURRENCY
+        self.global_bucket = TokenBucket(settings.TELEGRAM_GLOBAL_RATE if global_rate is None else global_rate)
+        self.chat_rate = settings.TELEGRAM_CHAT_RATE if chat_rate is None else chat_rate
+        self.chat_buckets = {}
+        self.max_retries = settings.TELEGRAM_MAX_RETRIES if max_retries is None else max_retries
+        self.paused_until = 0
+
+    async def send_all(self, messages):
+        results = [None] * len(messages)
+        queue = iter(enumerate(messages))
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=settings.TELEGRAM_TIMEOUT)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as client:
+            async def worker():
+                for index, message in queue:
+                    results[index] = await self.send(client, message)
+
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(messages)))))
+        return results
+
+    async def send(self, client, message):
+        chat_id = message['chat_id']
+        result = {'chat_id': chat_id, 'ok': False, 'status': None, 'error': None, 'retries': 0, 'latency': None}
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=1)
+
+        while True:
+            await self.wait_pause()
+            await self.chat_buckets[chat_id].acquire()
+            await self.global_bucket.acquire()
+
+            started = time.monotonic()
+            retry_after = None
+            try:
+                async with client.post(f'{URL}{TOKEN}/sendMessage', json=message) as response:
+                    result['status'] = response.status
+                    data = await _json_or_empty(response)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result['status'] = None
+                result['error'] = repr(e)
+            else:
+                if result['status'] == 200:
+                    result['ok'] = True
+                    result['error'] = None
+                else:
+                    result['error'] = data.get('description') or f'HTTP {result["status"]}'
+                    if result['status'] == 429:
+                        retry_after = (data.get('parameters') or {}).get('retry_after', 1)
+            result['latency'] = time.monotonic() - started
+
+            retryable = result['status'] is None or result['status'] == 429 or result['status'] >= 500
+            if result['ok'] or not retryable or result['retries'] >= self.max_retries:
+                return result
+
+            result['retries'] += 1
+            if retry_after is not None:
+                # флуд-контроль Telegram распространяется на весь бот
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            else:
+                await asyncio.sleep(0.5 * 2 ** (result['retries'] - 1))
+
+    async def wait_pause(self):
+        while (delay := self.paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+
+async def _json_or_empty(response):
+    try:
+        return await response.json(content_type=None) or {}
+    except ValueError:
+        return {}
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from habits.cache import get_habit_scopes, invalidate
+from habits.models import Habits
+
+
+@receiver([post_save, post_delete], sender=Habits)
+def invalidate_habit_cache(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш ответов, в которые могла попасть измененная привычка
+    """
+    invalidate(get_habit_scopes([instance]))
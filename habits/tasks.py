@@ -1,66 +1,461 @@
-from datetime import datetime, timedelta
-import requests
-from celery import shared_task
+import logging
+from datetime import timedelta
+
+from celery import chord, shared_task
 from django.conf import settings
-from habits.models import Habits
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from requests import RequestException
+from habits.cache import get_habit_scopes, invalidate
+from habits.completions import complete_habit, create_partitions
+from habits.metrics import DUE_HABITS, NOTIFICATIONS, QUEUE_LAG, observe_send_results, track_task
+from habits.models import Habits, NotificationOutbox, TelegramOffset, TelegramUpdate, advance_next_run_at
 from users.models import User
-from .services import send_message
+from .services import send_messages, session
 
 TOKEN = settings.TOKEN_BOT
 URL = settings.TELEGRAM_URL
 
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LENGTH = 4096
+# callback_data кнопки отметки выполнения: complete:<id привычки>
+COMPLETE_CALLBACK = 'complete:'
+
+REMINDER_FIELDS = ('id', 'action', 'place', 'time', 'time_to_complete', 'periodicity', 'next_run_at', 'is_public',
+                   'owner_id', 'owner__telegram_id')
+
 
 @shared_task
 def send_tg_message():
     """
-    Отправка сообщения в телеграм
+    Планирование отправки сообщений в телеграм: привычки, у которых наступило время,
+    делятся на диапазоны id владельцев и отправляются параллельными подзадачами
+    """
+    with track_task('plan') as stats:
+        now = timezone.now()
+        chunks = get_due_chunks(now, settings.REMINDER_CHUNK_SIZE)
+        if chunks:
+            chord(send_tg_chunk.s(first_id, last_id, now.isoformat()) for first_id, last_id in chunks)(
+                sum_chunk_results.s())
+        stats['chunks'] = len(chunks)
+    return len(chunks)
+
+
+def get_due_chunks(now, chunk_size):
+    """
+    Делит привычки, у которых наступило время, на диапазоны id владельцев примерно по chunk_size привычек.
+    Все привычки одного владельца попадают в один диапазон, чтобы его напоминания
+    отправлялись одной подзадачей
+    """
+    chunks = []
+    first_id = last_id = None
+    count = 0
+    due_owner_ids = Habits.objects.filter(next_run_at__lte=now).order_by('owner_id').values_list('owner_id', flat=True)
+    for owner_id in due_owner_ids.iterator(chunk_size=chunk_size):
+        if count >= chunk_size and owner_id != last_id:
+            chunks.append((first_id, last_id))
+            count = 0
+        if count == 0:
+            first_id = owner_id
+        last_id = owner_id
+        count += 1
+    if count:
+        chunks.append((first_id, last_id))
+    return chunks
+
+
+@shared_task
+def send_tg_chunk(first_id, last_id, now):
+    """
+    Отправка сообщений в телеграм по привычкам владельцев из диапазона id.
+    Привычки читаются потоком и пачками по REMINDER_BATCH_SIZE ставятся в очередь отправки,
+    после чего очередь этого диапазона отправляется
+    """
+    with track_task('chunk') as stats:
+        now = parse_datetime(now)
+        batch_size = settings.REMINDER_BATCH_SIZE
+        habits = (Habits.objects.filter(owner_id__gte=first_id, owner_id__lte=last_id, next_run_at__lte=now)
+                  .order_by('owner_id', 'id').values(*REMINDER_FIELDS))
+        counts = {'sent': 0, 'skipped': 0, 'failed': 0}
+        due = 0
+
+        batch = []
+        for habit in habits.iterator(chunk_size=batch_size):
+            batch.append(habit)
+            if len(batch) == batch_size:
+                counts['skipped'] += enqueue_notifications(batch, now)
+                due += len(batch)
+                batch = []
+        if batch:
+            counts['skipped'] += enqueue_notifications(batch, now)
+            due += len(batch)
+
+        delivered = deliver_notifications(
+            NotificationOutbox.objects.filter(habit__owner_id__gte=first_id, habit__owner_id__lte=last_id))
+        counts['sent'] += delivered['sent']
+        counts['failed'] += delivered['failed']
+
+        DUE_HABITS.observe(due)
+        NOTIFICATIONS.labels('skipped').inc(counts['skipped'])
+        stats.update(counts, due=due)
+    return counts
+
+
+def enqueue_notifications(habits, now):
+    """
+    В одной транзакции ставит напоминания по пачке привычек в очередь отправки и сдвигает их расписание.
+    Возвращает количество привычек, по которым напоминание не поставлено из-за отсутствия чата
+    """
+    to_send = [h for h in habits if h['owner__telegram_id']]
+    with transaction.atomic():
+        NotificationOutbox.objects.bulk_create(
+            [NotificationOutbox(habit_id=h['id'], chat_id=h['owner__telegram_id'], text=get_habit_text(h),
+                                scheduled_for=h['next_run_at'], next_attempt_at=now)
+             for h in to_send],
+            ignore_conflicts=True,
+        )
+        # привычки без чата тоже сдвигаются, иначе они выбирались бы на каждом запуске
+        Habits.objects.bulk_update(
+            [Habits(id=h['id'], next_run_at=advance_next_run_at(h['next_run_at'], h['periodicity'], now),
+                    updated_at=now)
+             for h in habits],
+            ['next_run_at', 'updated_at'],
+        )
+    # bulk_update не вызывает сигналы, а время следующего напоминания есть в ответах API
+    invalidate(get_habit_scopes(habits))
+    return len(habits) - len(to_send)
+
+
+@shared_task
+def deliver_pending_notifications():
+    """
+    Повторная отправка напоминаний из очереди, у которых наступило время следующей попытки
+    """
+    with track_task('deliver') as stats:
+        counts = deliver_notifications(NotificationOutbox.objects.all())
+        stats.update(counts)
+    return counts
+
+
+def deliver_notifications(queryset):
+    """
+    Отправляет ожидающие напоминания из queryset пачками по REMINDER_BATCH_SIZE.
+    В режиме REMINDER_DIGEST напоминания одного чата объединяются в одно сообщение.
+    Неудачные попытки откладываются с экспоненциальной задержкой, после OUTBOX_MAX_ATTEMPTS
+    напоминание помечается как неотправляемое
+    """
+    counts = {'sent': 0, 'failed': 0}
+    while True:
+        now = timezone.now()
+        notifications = claim_notifications(queryset, now, settings.REMINDER_BATCH_SIZE, settings.REMINDER_DIGEST)
+        if not notifications:
+            return counts
+
+        if settings.REMINDER_DIGEST:
+            groups = get_digest_groups(notifications, settings.REMINDER_DIGEST_MAX_HABITS)
+        else:
+            groups = [[notification] for notification in notifications]
+        results = send_messages([{'chat_id': group[0].chat_id, 'text': get_digest_text(group),
+                                  'reply_markup': get_completion_markup(group)} for group in groups])
+        observe_send_results(results)
+
+        sent_ids = []
+        failed = []
+        for notification, result in ((n, result) for group, result in zip(groups, results) for n in group):
+            if result['ok']:
+                sent_ids.append(notification.id)
+                QUEUE_LAG.observe((now - notification.scheduled_for).total_seconds())
+                continue
+            notification.attempts += 1
+            notification.last_error = result.get('error')
+            retryable = result.get('status') is None or result['status'] == 429 or result['status'] >= 500
+            if retryable and notification.attempts < settings.OUTBOX_MAX_ATTEMPTS:
+                notification.next_attempt_at = now + timedelta(
+                    seconds=settings.OUTBOX_RETRY_DELAY * 2 ** (notification.attempts - 1))
+            else:
+                notification.status = NotificationOutbox.STATUS_DEAD
+            failed.append(notification)
+
+        NotificationOutbox.objects.filter(id__in=sent_ids).update(
+            status=NotificationOutbox.STATUS_SENT, sent_at=now, attempts=F('attempts') + 1)
+        NotificationOutbox.objects.bulk_update(failed, ['attempts', 'last_error', 'next_attempt_at', 'status'])
+        counts['sent'] += len(sent_ids)
+        counts['failed'] += len(failed)
+        NOTIFICATIONS.labels('sent').inc(len(sent_ids))
+        for notification in failed:
+            NOTIFICATIONS.labels('dead' if notification.status == NotificationOutbox.STATUS_DEAD else 'retry').inc()
+
+
+def get_digest_groups(notifications, max_habits):
+    """
+    Группирует напоминания по чатам. Группа ограничена max_habits напоминаниями
+    и длиной сообщения Telegram, остальные напоминания переносятся в следующую группу
+    """
+    by_chat = {}
+    for notification in notifications:
+        by_chat.setdefault(notification.chat_id, []).append(notification)
+
+    groups = []
+    for chat_notifications in by_chat.values():
+        group = []
+        for notification in chat_notifications:
+            if group and (len(group) >= max_habits
+                          or len(get_digest_text(group + [notification])) > TELEGRAM_MESSAGE_LENGTH):
+                groups.append(group)
+                group = []
+            group.append(notification)
+        groups.append(group)
+    return groups
+
+
+def get_digest_text(notifications):
+    if len(notifications) == 1:
+        return notifications[0].text
+    return 'Напоминания:\n' + '\n'.join(f'{i}. {n.text}' for i, n in enumerate(notifications, 1))
+
+
+def get_completion_markup(notifications):
+    """
+    Кнопки отметки выполнения для привычек из сообщения, нажатие приходит обновлением callback_query
+    """
+    if len(notifications) == 1:
+        labels = ['Выполнено']
+    else:
+        labels = [f'Выполнено {i}' for i in range(1, len(notifications) + 1)]
+    return {'inline_keyboard': [[{'text': label, 'callback_data': f'{COMPLETE_CALLBACK}{n.habit_id}'}]
+                                for label, n in zip(labels, notifications)]}
+
+
+def claim_notifications(queryset, now, limit, by_chat=False):
+    """
+    Забирает до limit ожидающих напоминаний, откладывая их на OUTBOX_LEASE секунд,
+    чтобы параллельные обработчики не отправили их повторно.
+    by_chat - напоминания забираются по чатам, и чат, не поместившийся в пачку целиком,
+    переносится в следующую, чтобы дайджест чата собирался из одной пачки
     """
-    time_now = datetime.now().time()
-    start_time = (datetime.combine(datetime.today(), time_now) - timedelta(minutes=10)).time()
-    finish_time = (datetime.combine(datetime.today(), time_now) + timedelta(minutes=10)).time()
+    with transaction.atomic():
+        # блокируются только строки очереди, а не привычки из условия по владельцу (send_tg_chunk),
+        # иначе забор напоминаний мешал бы enqueue_notifications сдвигать расписание этих привычек
+        pending = (queryset.filter(status=NotificationOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+                   .select_for_update(skip_locked=True, of=('self',)))
+        if by_chat:
+            rows = list(pending.order_by('chat_id', 'scheduled_for', 'id').values_list('id', 'chat_id')[:limit + 1])
+            if len(rows) > limit:
+                # чат, на котором оборвалась пачка, уходит в следующую, если он не занимает ее целиком
+                last_chat = rows[limit][1]
+                rows = [row for row in rows[:limit] if row[1] != last_chat] or rows[:limit]
+            ids = [pk for pk, chat_id in rows]
+        else:
+            ids = list(pending.order_by('next_attempt_at').values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        NotificationOutbox.objects.filter(id__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE))
+    return list(NotificationOutbox.objects.filter(id__in=ids).only('id', 'habit_id', 'chat_id', 'text', 'attempts',
+                                                                           'scheduled_for'))
 
-    habits = Habits.objects.filter(time__gte=start_time, time__lte=finish_time)
 
-    updates = get_updates()
-    if updates['ok']:
-        parser_updates(updates['result'])
+@shared_task
+def purge_sent_notifications():
+    """
+    Удаление отправленных напоминаний старше OUTBOX_KEEP_DAYS дней
+    """
+    border = timezone.now() - timedelta(days=settings.OUTBOX_KEEP_DAYS)
+    return NotificationOutbox.objects.filter(status=NotificationOutbox.STATUS_SENT, sent_at__lt=border).delete()[0]
+
+
+def get_habit_text(habit):
+    return (f'Привычка: {habit["action"]} '
+            f'в {habit["place"]} '
+            f'время: {habit["time"]} '
+            f'на протяжении {habit["time_to_complete"]} минут')
+
 
-    for h in habits:
-        action = h.action
-        place = h.place
-        time = h.time
-        time_to_complete = h.time_to_complete
-        owner = h.owner
-        chat_id = owner.telegram_id
+@shared_task
+def sum_chunk_results(results):
+    """
+    Суммирует результаты подзадач отправки
+    """
+    totals = {'sent': 0, 'skipped': 0, 'failed': 0}
+    for counts in results:
+        for key in totals:
+            totals[key] += counts[key]
+    logger.info('Напоминания отправлены: %s', totals)
+    return totals
+
+
+class TelegramAPIError(Exception):
+    """
+    Ответ Telegram с ok: false. retry_after - пауза в секундах, которую требует Telegram (429)
+    """
 
-        if chat_id:
-            text = (f'Привычка: {action} '
-                    f'в {place} '
-                    f'время: {time} '
-                    f'на протяжении {time_to_complete} минут')
-            send_message(text, chat_id)
-            h.time = (datetime.combine(datetime.today(), h.time) + timedelta(days=h.periodicity)).time()
-            h.save()
+    def __init__(self, data):
+        super().__init__(f'{data.get("error_code")}: {data.get("description")}')
+        self.error_code = data.get('error_code')
+        self.retry_after = (data.get('parameters') or {}).get('retry_after')
 
 
-def get_updates():
+def get_updates(offset=None, timeout=0):
     """
-    Получает обновления от Telegram
+    Получает обновления от Telegram, начиная с offset.
+    timeout - время ожидания новых обновлений (long polling) в секундах
     """
-    response = requests.get(f'{URL}{TOKEN}/getUpdates')
+    params = {'timeout': timeout}
+    if offset:
+        params['offset'] = offset
+    response = session.get(f'{URL}{TOKEN}/getUpdates', params=params, timeout=timeout + settings.TELEGRAM_TIMEOUT)
     return response.json()
 
 
+def save_updates(updates):
+    """
+    Сохраняет полученные обновления в очередь на обработку
+    """
+    TelegramUpdate.objects.bulk_create(
+        [TelegramUpdate(update_id=update['update_id'], payload=update) for update in updates],
+        ignore_conflicts=True,
+    )
+
+
+def poll_updates(timeout):
+    """
+    Один цикл long polling: получает новые обновления, сохраняет их вместе со смещением
+    и обрабатывает. Возвращает количество полученных обновлений.
+    Ошибка Telegram (webhook включен, неверный токен, 429) - TelegramAPIError
+    """
+    offset = TelegramOffset.get()
+    updates = get_updates(offset.update_id + 1 if offset.update_id else None, timeout)
+    if not updates['ok']:
+        raise TelegramAPIError(updates)
+    if not updates['result']:
+        return 0
+
+    with transaction.atomic():
+        save_updates(updates['result'])
+        offset.update_id = max(update['update_id'] for update in updates['result'])
+        offset.save(update_fields=['update_id'])
+    process_telegram_updates()
+    return len(updates['result'])
+
+
+@shared_task
+def process_telegram_updates():
+    """
+    Обработка накопленных обновлений Telegram пачками
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            batch = list(TelegramUpdate.objects.select_for_update(skip_locked=True).order_by('update_id')
+                         .values_list('id', 'payload')[:settings.TELEGRAM_UPDATES_BATCH_SIZE])
+            if not batch:
+                return processed
+            payloads = [payload for pk, payload in batch]
+            parser_updates(payloads)
+            answers = parser_callbacks(payloads)
+            TelegramUpdate.objects.filter(id__in=[pk for pk, payload in batch]).delete()
+        # ответы на нажатия кнопок отправляются после фиксации, чтобы не держать транзакцию на запросах к API
+        answer_callbacks(answers)
+        processed += len(batch)
+
+
 def parser_updates(updates):
+    """
+    Сохраняет chat_id пользователей, написавших боту.
+    Для каждого ника учитывается последнее обновление
+    """
+    chat_ids = {}
     for update in updates:
+        if 'message' not in update:
+            continue
         chat = update['message']['chat']
         username = chat.get('username')
         chat_id = chat['id']
 
         if username:
-            try:
-                user = User.objects.get(telegram_nik=username)
-                user.chat_id = chat_id
-                user.save()
-            except User.DoesNotExist:
+            chat_ids[username] = str(chat_id)
+
+    if not chat_ids:
+        return
+    users = User.objects.filter(telegram_nik__in=chat_ids).only('id', 'telegram_nik', 'telegram_id')
+    changed = [user for user in users if user.telegram_id != chat_ids[user.telegram_nik]]
+    now = timezone.now()
+    for user in changed:
+        user.telegram_id = chat_ids[user.telegram_nik]
+        user.updated_at = now
+    User.objects.bulk_update(changed, ['telegram_id', 'updated_at'], batch_size=1000)
+
+
+def parser_callbacks(updates):
+    """
+    Отмечает выполнение привычек по нажатию кнопки в напоминании.
+    Привычка отмечается, только если кнопку нажал ее владелец. Возвращает ответы на нажатия
+    """
+    callbacks = {}
+    for update in updates:
+        callback = update.get('callback_query')
+        if not callback or not str(callback.get('data', '')).startswith(COMPLETE_CALLBACK):
+            continue
+        habit_id = callback['data'][len(COMPLETE_CALLBACK):]
+        if habit_id.isdigit():
+            callbacks[callback['id']] = (int(habit_id), str(callback['from']['id']))
+    if not callbacks:
+        return []
+
+    owners = dict(Habits.objects.filter(id__in={habit_id for habit_id, _ in callbacks.values()})
+                  .values_list('id', 'owner__telegram_id'))
+    answers = []
+    for callback_id, (habit_id, chat_id) in callbacks.items():
+        if owners.get(habit_id) != chat_id:
+            answers.append((callback_id, 'Привычка не найдена'))
+            continue
+        habit, created = complete_habit(habit_id)
+        text = f'Выполнено! Серия: {habit.current_streak}' if created else 'Сегодня уже отмечено'
+        answers.append((callback_id, text))
+    return answers
+
+
+def answer_callbacks(answers):
+    for callback_id, text in answers:
+        try:
+            session.post(f'{URL}{TOKEN}/answerCallbackQuery', data={'callback_query_id': callback_id, 'text': text},
+                         timeout=settings.TELEGRAM_TIMEOUT)
+        except RequestException as e:
+            # без ответа Telegram лишь дольше показывает индикатор загрузки на кнопке
+            logger.warning('Не удалось ответить на нажатие кнопки: %s', e)
+
+
+@shared_task
+def reset_broken_streaks():
+    """
+    Обнуляет текущую серию привычек, которые не выполнялись дольше своей периодичности,
+    чтобы серия читалась из привычки без обращения к истории выполнений
+    """
+    today = timezone.localdate()
+    reset = 0
+    for periodicity in range(1, 8):
+        with transaction.atomic():
+            queryset = Habits.objects.filter(periodicity=periodicity, current_streak__gt=0,
+                                             last_completed_on__lt=today - timedelta(days=periodicity))
+            habits = list(queryset.select_for_update().values('id', 'owner_id', 'is_public'))
+            if not habits:
                 continue
+            Habits.objects.filter(id__in=[h['id'] for h in habits]).update(current_streak=0,
+                                                                          updated_at=timezone.now())
+            invalidate(get_habit_scopes(habits))
+        reset += len(habits)
+    return reset
+
+
+@shared_task
+def create_completion_partitions():
+    """
+    Заранее создает месячные секции таблицы выполнений привычек (только PostgreSQL)
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        create_partitions(cursor, timezone.localdate(), settings.HABITS_COMPLETION_PARTITIONS_AHEAD)
@@ -1,7 +1,43 @@
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import ANY, patch
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from prometheus_client import REGISTRY
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from psycopg2 import OperationalError, extensions
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import Habits
+from rest_framework_simplejwt.tokens import AccessToken
+from .cache import get_or_compute, get_version
+from .completions import complete_habit
+from .fake_telegram import FakeTelegramServer
+from .models import HabitCompletion, Habits, NotificationOutbox, TelegramOffset, TelegramUpdate, advance_next_run_at, \
+    get_next_run_at
+from .serializer import HabitsReadSerializer, HabitsSerializer
+from .services import TelegramSender, TokenBucket, send_messages
+from .views import HabitListAPIView, HabitRetrieveAPIView, PublicHabitListAPIView
+from .tasks import REMINDER_FIELDS, claim_notifications, deliver_notifications, deliver_pending_notifications, \
+    enqueue_notifications, get_due_chunks, parser_updates, poll_updates, process_telegram_updates, \
+    reset_broken_streaks, send_tg_chunk, send_tg_message, sum_chunk_results, TelegramAPIError
+from config import schema as schema_module
+from config.postgresql_pool.pool import ConnectionPool
 from users.models import User
 
 
@@ -100,7 +136,7 @@ class HabitListAPIViewTest(APITestCase):
         """
         response = self.client.get(self.url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual([habit['id'] for habit in response.json()['results']], [self.habit.pk])
         self.assertEqual(response.data['results'][0]['owner'], self.user.id)
 
     """
@@ -155,10 +191,63 @@ class PublicHabitListAPIViewTest(APITestCase):
         """
         response = self.client.get(self.url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual([habit['id'] for habit in response.json()['results']], [self.habit.pk])
         self.assertTrue(response.data['results'][0]['is_public'])
 
 
+class HabitCursorPaginationTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='cursor@example.com')
+        self.url = reverse('habits:pablichabit_list')
+        self.habits = [
+            Habits.objects.create(owner=self.user, place='Park', time=f'0{7 - i % 3}:00:00', action=f'Action {i}',
+                                  time_to_complete=30, is_public=True)
+            for i in range(12)
+        ]
+
+    def get_pages(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            url = response.data['next']
+        return pages
+
+    def test_cursor_pages_by_id(self):
+        """
+        Проверяем, что курсор проходит все привычки по id без повторов и без подсчета COUNT(*)
+        """
+        with CaptureQueriesContext(connection) as queries:
+            pages = self.get_pages(f'{self.url}?pagination=cursor')
+
+        self.assertEqual([habit['id'] for page in pages for habit in page['results']],
+                         [habit.id for habit in self.habits])
+        self.assertEqual(len(queries), len(pages))
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        self.assertNotIn('count', pages[0])
+
+    def test_cursor_pages_by_time(self):
+        """
+        Проверяем порядок (time, id) и возврат на предыдущую страницу
+        """
+        pages = self.get_pages(f'{self.url}?pagination=cursor&ordering=time')
+        expected = sorted(self.habits, key=lambda habit: (habit.time, habit.id))
+        self.assertEqual([habit['id'] for page in pages for habit in page['results']], [habit.id for habit in expected])
+
+        previous = self.client.get(pages[1]['previous'])
+        self.assertEqual(previous.data['results'], pages[0]['results'])
+
+    def test_page_number_is_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], 12)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'bad'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class HabitRetrieveAPIViewTest(APITestCase):
 
     def setUp(self):
@@ -206,7 +295,7 @@ class HabitRetrieveAPIViewTest(APITestCase):
         """
         url = reverse('habits:habit_detail', kwargs={'pk': self.habit2.id})
         response = self.client.get(url, format='json')
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_retrieve_habit_as_admin(self):
         """
@@ -267,7 +356,7 @@ class HabitUpdateAPIViewTest(APITestCase):
         url = reverse('habits:habit_update', kwargs={'pk': self.habit2.id})
         data = {'action': 'Swimming'}
         response = self.client.put(url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_update_habit_as_admin(self):
         """
@@ -327,7 +416,7 @@ class HabitDestroyAPIViewTest(APITestCase):
         """
         url = reverse('habits:habit_delete', kwargs={'pk': self.habit2.id})
         response = self.client.delete(url)
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertTrue(Habits.objects.filter(pk=self.habit2.id).exists())
 
     def test_destroy_habit_as_admin(self):
@@ -339,3 +428,1177 @@ class HabitDestroyAPIViewTest(APITestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Habits.objects.filter(pk=self.habit1.id).exists())
+
+
+class HabitScheduleTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='schedule@example.com', telegram_id='100')
+
+    def test_next_run_at_after_midnight(self):
+        """
+        Проверяем, что время напоминания корректно переходит через полночь
+        """
+        now = datetime(2024, 7, 3, 23, 55, tzinfo=dt_timezone.utc)
+        self.assertEqual(get_next_run_at(time(0, 5), now), datetime(2024, 7, 4, 0, 5, tzinfo=dt_timezone.utc))
+        self.assertEqual(get_next_run_at(time(23, 58), now), datetime(2024, 7, 3, 23, 58, tzinfo=dt_timezone.utc))
+
+    def test_advance_skips_missed_periods(self):
+        """
+        Проверяем, что пропущенные периоды не приводят к пачке напоминаний
+        """
+        now = datetime(2024, 7, 10, 12, 0, tzinfo=dt_timezone.utc)
+        next_run_at = datetime(2024, 7, 3, 7, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(advance_next_run_at(next_run_at, 3, now), datetime(2024, 7, 12, 7, 0, tzinfo=dt_timezone.utc))
+
+    def test_create_sets_next_run_at(self):
+        habit = Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action='Jogging',
+                                      time_to_complete=30)
+        self.assertIsNotNone(habit.next_run_at)
+        self.assertGreater(habit.next_run_at, timezone.now())
+
+    def test_send_tg_message_sends_due_habit_once(self):
+        """
+        Проверяем, что привычка отправляется один раз и переносится на следующий период
+        """
+        habit = Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action='Jogging',
+                                      time_to_complete=30, periodicity=2,
+                                      next_run_at=timezone.now() - timedelta(minutes=1))
+        Habits.objects.create(owner=self.user, place='Gym', time='08:00:00', action='Workout',
+                              time_to_complete=30, next_run_at=timezone.now() + timedelta(hours=1))
+
+        now = timezone.now()
+        with patch('habits.tasks.send_messages', side_effect=lambda messages: [{'ok': True}] * len(messages)) as send:
+            counts = send_tg_chunk(self.user.id, self.user.id, now.isoformat())
+            send_tg_chunk(self.user.id, self.user.id, now.isoformat())
+
+        self.assertEqual(counts, {'sent': 1, 'skipped': 0, 'failed': 0})
+        send.assert_called_once_with([{'chat_id': '100', 'text': ANY, 'reply_markup': {
+            'inline_keyboard': [[{'text': 'Выполнено', 'callback_data': f'complete:{habit.id}'}]]}}])
+        habit.refresh_from_db()
+        self.assertGreater(habit.next_run_at, timezone.now() + timedelta(days=1))
+
+    def test_failed_notification_is_retried(self):
+        """
+        Проверяем, что неотправленное напоминание остается в очереди с отложенной попыткой,
+        а расписание привычки при этом сдвигается
+        """
+        habit = Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action='Jogging',
+                                      time_to_complete=30, next_run_at=timezone.now() - timedelta(minutes=1))
+        with patch('habits.tasks.send_messages', return_value=[{'ok': False, 'status': 502, 'error': 'Bad Gateway'}]):
+            counts = send_tg_chunk(self.user.id, self.user.id, timezone.now().isoformat())
+
+        self.assertEqual(counts, {'sent': 0, 'skipped': 0, 'failed': 1})
+        habit.refresh_from_db()
+        self.assertGreater(habit.next_run_at, timezone.now())
+        notification = NotificationOutbox.objects.get(habit=habit)
+        self.assertEqual(notification.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+        with patch('habits.tasks.send_messages') as send:
+            self.assertEqual(deliver_pending_notifications(), {'sent': 0, 'failed': 0})
+        send.assert_not_called()
+
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+        with patch('habits.tasks.send_messages', return_value=[{'ok': True}]):
+            self.assertEqual(deliver_pending_notifications(), {'sent': 1, 'failed': 0})
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, NotificationOutbox.STATUS_SENT)
+        self.assertEqual(notification.attempts, 2)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_notification_dead_after_max_attempts(self):
+        habit = Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action='Jogging',
+                                      time_to_complete=30)
+        notification = NotificationOutbox.objects.create(habit=habit, chat_id='100', text='text',
+                                                         scheduled_for=habit.next_run_at, attempts=1)
+        with patch('habits.tasks.send_messages', return_value=[{'ok': False, 'status': None, 'error': 'timeout'}]):
+            deliver_pending_notifications()
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, NotificationOutbox.STATUS_DEAD)
+        self.assertEqual(notification.last_error, 'timeout')
+
+    def test_enqueue_is_idempotent(self):
+        """
+        Проверяем, что повторное планирование того же напоминания не создает дубликат
+        """
+        habit = Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action='Jogging',
+                                      time_to_complete=30, next_run_at=timezone.now() - timedelta(minutes=1))
+        row = Habits.objects.filter(pk=habit.pk).values(*REMINDER_FIELDS).get()
+        enqueue_notifications([row], timezone.now())
+        enqueue_notifications([row], timezone.now())
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+
+
+class ReminderPlannerTest(TestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create(email=f'planner{i}@example.com') for i in range(3)]
+        for user, count in zip(self.users, [2, 1, 2]):
+            for _ in range(count):
+                Habits.objects.create(owner=user, place='Park', time='07:00:00', action='Jogging',
+                                      time_to_complete=30, next_run_at=timezone.now() - timedelta(minutes=1))
+        Habits.objects.create(owner=self.users[0], place='Gym', time='08:00:00', action='Workout',
+                              time_to_complete=30, next_run_at=timezone.now() + timedelta(hours=1))
+
+    def test_get_due_chunks(self):
+        """
+        Проверяем, что привычки делятся на диапазоны владельцев и владелец не разрывается между диапазонами
+        """
+        ids = [user.id for user in self.users]
+        chunks = get_due_chunks(timezone.now(), chunk_size=2)
+        self.assertEqual(chunks, [(ids[0], ids[0]), (ids[1], ids[2])])
+
+    def test_send_tg_message_dispatches_chord(self):
+        with patch('habits.tasks.chord') as chord, self.settings(REMINDER_CHUNK_SIZE=1):
+            self.assertEqual(send_tg_message(), 3)
+
+        header = list(chord.call_args.args[0])
+        self.assertEqual(len(header), 3)
+        self.assertEqual(header[0].args[:2], (self.users[0].id, self.users[0].id))
+
+    def test_sum_chunk_results(self):
+        results = [{'sent': 2, 'skipped': 1, 'failed': 0}, {'sent': 1, 'skipped': 0, 'failed': 3}]
+        self.assertEqual(sum_chunk_results(results), {'sent': 3, 'skipped': 1, 'failed': 3})
+
+
+class TelegramSenderTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeTelegramServer(retry_after=0, blocked_chats=['blocked']).start()
+        self.addCleanup(self.server.stop)
+        patcher = patch('habits.services.URL', self.server.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=2, capacity=1)
+        self.assertEqual(bucket.take(), 0)
+        self.assertGreater(bucket.take(), 0)
+
+    def test_send_messages_results_in_order(self):
+        """
+        Проверяем, что результаты идут в порядке сообщений, а ошибка чата не повторяется
+        """
+        messages = [{'chat_id': i, 'text': 'x'} for i in range(200)]
+        messages[10] = {'chat_id': 'blocked', 'text': 'x'}
+        with self.settings(TELEGRAM_CONCURRENCY=20, TELEGRAM_CHAT_RATE=0, TELEGRAM_GLOBAL_RATE=0):
+            results = send_messages(messages)
+
+        self.assertEqual([result['chat_id'] for result in results], [m['chat_id'] for m in messages])
+        self.assertEqual(sum(result['ok'] for result in results), 199)
+        self.assertEqual(results[10]['status'], 403)
+        self.assertEqual(results[10]['retries'], 0)
+        self.assertEqual(self.server.sent, 199)
+
+    def test_send_messages_retries_after_429(self):
+        self.server.rate_limit_rate = 1
+        sender = TelegramSender(concurrency=1, global_rate=0, chat_rate=0, max_retries=2)
+        result = asyncio.run(sender.send_all([{'chat_id': 1, 'text': 'x'}]))[0]
+
+        self.assertFalse(result['ok'])
+        self.assertEqual(result['status'], 429)
+        self.assertEqual(result['retries'], 2)
+        self.assertEqual(self.server.requests, 3)
+
+
+class TelegramUpdatesTest(APITestCase):
+
+    def update(self, update_id):
+        return {'update_id': update_id, 'message': {'chat': {'id': update_id, 'username': 'nik'}}}
+
+    def test_poll_updates_uses_saved_offset(self):
+        """
+        Проверяем, что повторный опрос запрашивает обновления после последнего полученного
+        """
+        with patch('habits.tasks.get_updates',
+                   return_value={'ok': True, 'result': [self.update(10), self.update(11)]}) as get_updates, \
+                patch('habits.tasks.parser_updates') as parser:
+            self.assertEqual(poll_updates(timeout=0), 2)
+            poll_updates(timeout=0)
+
+        self.assertEqual(get_updates.call_args_list[0].args, (None, 0))
+        self.assertEqual(get_updates.call_args_list[1].args, (12, 0))
+        self.assertEqual(TelegramOffset.get().update_id, 11)
+        self.assertEqual(parser.call_args_list[0].args[0], [self.update(10), self.update(11)])
+        self.assertFalse(TelegramUpdate.objects.exists())
+
+    def test_poll_updates_error_backs_off(self):
+        """
+        Проверяем, что ответ ok: false не приводит к повторному опросу без паузы:
+        при 429 выдерживается retry_after, при других ошибках пауза растет
+        """
+        flood = {'ok': False, 'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': 7}}
+        conflict = {'ok': False, 'error_code': 409, 'description': 'Conflict'}
+        with patch('habits.tasks.get_updates', return_value=flood):
+            with self.assertRaises(TelegramAPIError) as error:
+                poll_updates(timeout=0)
+        self.assertEqual(error.exception.retry_after, 7)
+
+        with patch('habits.tasks.get_updates', side_effect=[flood, conflict, conflict]), \
+                patch('habits.management.commands.poll_updates.time.sleep',
+                      side_effect=[None, None, KeyboardInterrupt]) as sleep:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('poll_updates', stderr=StringIO())
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [7, 2, 4])
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET='secret')
+    def test_webhook_queues_update(self):
+        url = reverse('telegram_webhook')
+        response = self.client.post(url, self.update(5), format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        for _ in range(2):
+            response = self.client.post(url, self.update(5), format='json',
+                                        HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='secret')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(TelegramUpdate.objects.count(), 1)
+
+        with patch('habits.tasks.parser_updates') as parser:
+            self.assertEqual(process_telegram_updates(), 1)
+        parser.assert_called_once_with([self.update(5)])
+        self.assertFalse(TelegramUpdate.objects.exists())
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET='secret')
+    def test_webhook_wrong_secret(self):
+        response = self.client.post(reverse('telegram_webhook'), self.update(5), format='json',
+                                    HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='wrong')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(TelegramUpdate.objects.exists())
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET=None)
+    def test_webhook_without_secret(self):
+        """
+        Проверяем, что без настроенного секрета webhook не принимает обновления
+        """
+        for headers in ({}, {'HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN': ''}):
+            response = self.client.post(reverse('telegram_webhook'), self.update(5), format='json', **headers)
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(TelegramUpdate.objects.exists())
+
+    def test_parser_updates_sets_telegram_id(self):
+        """
+        Проверяем, что chat_id сохраняется за фиксированное число запросов и берется из последнего обновления
+        """
+        users = [User.objects.create(email=f'user{i}@example.com', telegram_nik=f'nik{i}') for i in range(3)]
+        users[2].telegram_id = '2'
+        users[2].save()
+        updates = [{'update_id': i, 'message': {'chat': {'id': i, 'username': f'nik{i % 3}'}}} for i in range(6)]
+        updates.append({'update_id': 7, 'message': {'chat': {'id': 7, 'username': 'unknown'}}})
+
+        with self.assertNumQueries(2):
+            parser_updates(updates)
+
+        self.assertEqual([user.telegram_id for user in User.objects.order_by('id')], ['3', '4', '5'])
+
+
+class ReminderBatchTest(TestCase):
+
+    def test_send_tg_chunk_query_count(self):
+        """
+        Проверяем, что число запросов к базе не зависит от количества владельцев привычек
+        """
+        due = timezone.now() - timedelta(minutes=1)
+        for i in range(10):
+            owner = User.objects.create(email=f'batch{i}@example.com', telegram_id=str(i) if i % 5 else None)
+            Habits.objects.create(owner=owner, place='Park', time='07:00:00', action='Jogging',
+                                  time_to_complete=30, next_run_at=due)
+
+        with patch('habits.tasks.send_messages', side_effect=lambda messages: [{'ok': True}] * len(messages)), \
+                self.settings(REMINDER_BATCH_SIZE=4), CaptureQueriesContext(connection) as queries:
+            counts = send_tg_chunk(0, 10 ** 9, timezone.now().isoformat())
+
+        self.assertEqual(counts, {'sent': 8, 'skipped': 2, 'failed': 0})
+        # поток привычек, затем по две выборки на каждую из двух пачек очереди и завершающая пустая выборка
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('SELECT')]), 6)
+        self.assertEqual(NotificationOutbox.objects.filter(status=NotificationOutbox.STATUS_SENT).count(), 8)
+        self.assertFalse(Habits.objects.filter(next_run_at__lte=timezone.now()).exists())
+
+
+    @skipUnless(connection.vendor == 'postgresql', 'SELECT ... FOR UPDATE есть только в PostgreSQL')
+    def test_claim_locks_only_outbox(self):
+        """
+        Проверяем, что забор напоминаний с условием по владельцу не блокирует строки привычек
+        """
+        owner = User.objects.create(email='lock@example.com', telegram_id='1')
+        habit = Habits.objects.create(owner=owner, place='Park', time='07:00:00', action='Jogging',
+                                      time_to_complete=30)
+        NotificationOutbox.objects.create(habit=habit, chat_id='1', text='Jogging', scheduled_for=timezone.now())
+
+        with CaptureQueriesContext(connection) as queries:
+            claim_notifications(NotificationOutbox.objects.filter(habit__owner_id=owner.id), timezone.now(), 10)
+        select = [q['sql'] for q in queries if 'FOR UPDATE' in q['sql']][0]
+        self.assertIn('FOR UPDATE OF "habits_notificationoutbox" SKIP LOCKED', select)
+
+class BenchmarkRemindersCommandTest(TestCase):
+
+    def test_benchmark_sends_all_and_cleans_up(self):
+        out = StringIO()
+        call_command('benchmark_reminders', habits=30, users=5, stdout=out)
+
+        self.assertIn("'sent': 30", out.getvalue())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Habits.objects.exists())
+
+    def test_benchmark_serializers(self):
+        out = StringIO()
+        call_command('benchmark_serializers', page_size=5, repeat=1, stdout=out)
+        self.assertIn('HabitsReadSerializer:', out.getvalue())
+
+
+@override_settings(REMINDER_DIGEST=True, REMINDER_DIGEST_MAX_HABITS=2)
+class ReminderDigestTest(TestCase):
+
+    def test_digest_groups_by_chat(self):
+        """
+        Проверяем, что напоминания одного чата объединяются в сообщения не больше чем по две привычки
+        """
+        due = timezone.now() - timedelta(minutes=1)
+        first = User.objects.create(email='digest1@example.com', telegram_id='1')
+        second = User.objects.create(email='digest2@example.com', telegram_id='2')
+        for owner, count in ((first, 3), (second, 1)):
+            for i in range(count):
+                Habits.objects.create(owner=owner, place='Park', time='07:00:00', action=f'Action {i}',
+                                      time_to_complete=30, next_run_at=due)
+
+        with patch('habits.tasks.send_messages', side_effect=lambda messages: [{'ok': True}] * len(messages)) as send:
+            counts = send_tg_chunk(first.id, second.id, timezone.now().isoformat())
+
+        self.assertEqual(counts, {'sent': 4, 'skipped': 0, 'failed': 0})
+        messages = send.call_args.args[0]
+        self.assertEqual([message['chat_id'] for message in messages], ['1', '1', '2'])
+        self.assertTrue(messages[0]['text'].startswith('Напоминания:\n1. Привычка: Action 0'))
+        self.assertIn('2. Привычка: Action 1', messages[0]['text'])
+        self.assertTrue(messages[2]['text'].startswith('Привычка: Action 0'))
+
+
+    def test_digest_chat_not_split_between_batches(self):
+        """
+        Проверяем, что напоминания чата забираются одной пачкой и уходят одним дайджестом
+        """
+        now = timezone.now()
+        owners = [User.objects.create(email=f'digest{i}@example.com', telegram_id=str(i)) for i in (1, 2)]
+        for i in range(4):
+            habit = Habits.objects.create(owner=owners[i % 2], place='Park', time='07:00:00', action=f'Action {i}',
+                                          time_to_complete=30)
+            NotificationOutbox.objects.create(habit=habit, chat_id=habit.owner.telegram_id, text=f'Action {i}',
+                                              scheduled_for=now, next_attempt_at=now - timedelta(minutes=4 - i))
+
+        with patch('habits.tasks.send_messages', side_effect=lambda messages: [{'ok': True}] * len(messages)) as send, \
+                self.settings(REMINDER_BATCH_SIZE=3):
+            counts = deliver_notifications(NotificationOutbox.objects.all())
+
+        self.assertEqual(counts, {'sent': 4, 'failed': 0})
+        messages = [message for call in send.call_args_list for message in call.args[0]]
+        self.assertEqual([message['chat_id'] for message in messages], ['1', '2'])
+
+@override_settings(METRICS_TOKEN='metrics')
+class ReminderMetricsTest(APITestCase):
+
+    def test_chunk_updates_metrics(self):
+        """
+        Проверяем, что отправка напоминаний отражается в метриках и они доступны на /metrics/
+        """
+        owner = User.objects.create(email='metrics@example.com', telegram_id='1')
+        Habits.objects.create(owner=owner, place='Park', time='07:00:00', action='Jogging',
+                              time_to_complete=30, next_run_at=timezone.now() - timedelta(minutes=1))
+        sent_before = REGISTRY.get_sample_value('habits_notifications_total', {'result': 'sent'}) or 0
+        chunks_before = REGISTRY.get_sample_value('habits_task_duration_seconds_count', {'task': 'chunk'}) or 0
+
+        with patch('habits.tasks.send_messages', return_value=[{'ok': True, 'latency': 0.01, 'retries': 1}]):
+            send_tg_chunk(owner.id, owner.id, timezone.now().isoformat())
+
+        self.assertEqual(REGISTRY.get_sample_value('habits_notifications_total', {'result': 'sent'}), sent_before + 1)
+        self.assertEqual(REGISTRY.get_sample_value('habits_task_duration_seconds_count', {'task': 'chunk'}),
+                         chunks_before + 1)
+
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'habits_notification_lag_seconds_bucket', response.content)
+        self.assertIn(b'habits_telegram_retries_total', response.content)
+
+    def test_metrics_require_token(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_TOKEN=None):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_metrics_from_container_directories(self):
+        """
+        Проверяем, что метрики собираются из каталогов всех контейнеров, даже при одинаковых PID
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('app', 'celery'):
+                os.makedirs(f'{directory}/{name}')
+                values = MmapedDict(f'{directory}/{name}/counter_1.db')
+                values.write_value(mmap_key('habits_notifications_total', 'habits_notifications_total',
+                                            ['result'], ['sent'], ''), 2, 0)
+                values.close()
+            with patch.dict(os.environ, {'PROMETHEUS_METRICS_DIR': directory}):
+                response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer metrics')
+        self.assertIn(b'habits_notifications_total{result="sent"} 4.0', response.content)
+
+
+@override_settings(HABITS_CACHE_LOCK_TIMEOUT=0.2)
+class HabitResponseCacheTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='cache@example.com')
+        self.other = User.objects.create(email='other@example.com')
+        self.habit = Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action='Jogging',
+                                           time_to_complete=30, is_public=True)
+
+    def test_public_list_cached_until_habit_changes(self):
+        url = reverse('habits:pablichabit_list')
+        first = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(second.json(), first.json())
+
+        self.habit.action = 'Swimming'
+        self.habit.save()
+        Habits.objects.create(owner=self.other, place='Pool', time='08:00:00', action='Diving',
+                              time_to_complete=30, is_public=True)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(response.json()['results'][0]['action'], 'Swimming')
+
+    def test_owner_list_invalidated_by_reminder_batch(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('habits:habits_list')
+        Habits.objects.filter(pk=self.habit.pk).update(next_run_at=timezone.now() - timedelta(minutes=1))
+        before = self.client.get(url).json()['results'][0]['next_run_at']
+        row = Habits.objects.filter(pk=self.habit.pk).values(*REMINDER_FIELDS).get()
+        enqueue_notifications([row], timezone.now())
+
+        after = self.client.get(url).json()['results'][0]['next_run_at']
+        self.assertGreater(after, before)
+
+    def test_private_changes_keep_public_cache(self):
+        """
+        Проверяем, что изменение и перенос напоминания непубличной привычки не сбрасывают публичный список,
+        а снятие признака публичности сбрасывает
+        """
+        private = Habits.objects.create(owner=self.user, place='Home', time='08:00:00', action='Reading',
+                                        time_to_complete=30, is_public=False)
+        version = get_version('public')
+
+        private = Habits.objects.get(pk=private.pk)
+        private.action = 'Writing'
+        private.save()
+        Habits.objects.filter(pk=private.pk).update(next_run_at=timezone.now() - timedelta(minutes=1))
+        enqueue_notifications([Habits.objects.filter(pk=private.pk).values(*REMINDER_FIELDS).get()], timezone.now())
+        self.assertEqual(get_version('public'), version)
+
+        habit = Habits.objects.get(pk=self.habit.pk)
+        habit.is_public = False
+        habit.save()
+        self.assertNotEqual(get_version('public'), version)
+
+    def test_retrieve_cached_per_user(self):
+        url = reverse('habits:habit_detail', args=[self.habit.pk])
+        self.client.force_authenticate(self.user)
+        self.client.get(url)
+        self.client.force_authenticate(self.other)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertGreater(len(queries), 0)
+
+    def test_single_flight_waits_for_running_computation(self):
+        """
+        Проверяем, что при занятой блокировке запрос ждет значения в кэше, а не вычисляет его сам
+        """
+        cache.add('key:lock', 1)
+        with patch.object(cache, 'get', side_effect=[None, None, b'ready']) as get:
+            self.assertEqual(get_or_compute('key', lambda: self.fail('значение вычислено повторно')), b'ready')
+        self.assertEqual(get.call_count, 3)
+
+
+class HabitConditionalGetTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='etag@example.com')
+        self.habit = Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action='Jogging',
+                                           time_to_complete=30)
+        self.client.force_authenticate(self.user)
+
+    def test_list_not_modified(self):
+        """
+        Проверяем, что неизмененный список отдается ответом 304 за один запрос к базе
+        """
+        url = reverse('habits:habits_list')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 1)
+
+        Habits.objects.create(owner=self.user, place='Gym', time='08:00:00', action='Workout', time_to_complete=30)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_after_delete(self):
+        """
+        Проверяем, что после удаления самой свежей привычки список не считается неизмененным
+        """
+        Habits.objects.filter(pk=self.habit.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        newest = Habits.objects.create(owner=self.user, place='Gym', time='08:00:00', action='Workout',
+                                       time_to_complete=30)
+        url = reverse('habits:habits_list')
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        last_modified = http_date(newest.updated_at.timestamp())
+
+        newest.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([habit['id'] for habit in response.json()['results']], [self.habit.pk])
+
+    def test_detail_if_modified_since(self):
+        url = reverse('habits:habit_detail', args=[self.habit.pk])
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Habits.objects.filter(pk=self.habit.pk).update(updated_at=timezone.now() + timedelta(minutes=1))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class HabitBulkAPIViewTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='bulk@example.com')
+        self.other = User.objects.create(email='bulk-other@example.com')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('habits:habit_bulk')
+
+    def create_habit(self, owner, action):
+        return Habits.objects.create(owner=owner, place='Park', time='07:00:00', action=action, time_to_complete=30)
+
+    def test_bulk_create(self):
+        """
+        Проверяем, что пачка привычек создается одним INSERT и получает расписание
+        """
+        data = [{'place': 'Park', 'time': '07:00:00', 'action': f'Action {i}', 'time_to_complete': 30,
+                 'periodicity': 1, 'owner': self.other.id} for i in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('INSERT')]), 1)
+        self.assertEqual(Habits.objects.filter(owner=self.user, next_run_at__isnull=False).count(), 20)
+
+    def test_bulk_create_is_atomic(self):
+        data = [{'place': 'Park', 'time': '07:00:00', 'action': 'Jogging', 'time_to_complete': 30, 'periodicity': 1},
+                {'place': 'Park', 'time': '07:00:00', 'action': 'Jogging', 'time_to_complete': 500, 'periodicity': 1}]
+        response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('non_field_errors', response.data[1])
+        self.assertFalse(Habits.objects.exists())
+
+    def test_bulk_update(self):
+        habits = [self.create_habit(self.user, f'Action {i}') for i in range(3)]
+        data = [{'id': habit.id, 'action': f'New {habit.id}'} for habit in habits]
+        data[0]['time'] = '09:30:00'
+        response = self.client.patch(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['action'] for item in response.data], [f'New {habit.id}' for habit in habits])
+        habits[0].refresh_from_db()
+        self.assertEqual(habits[0].time, time(9, 30))
+        self.assertEqual(timezone.localtime(habits[0].next_run_at).time(), time(9, 30))
+
+    def test_bulk_queries_do_not_depend_on_size(self):
+        """
+        Проверяем, что число запросов пакетного создания и изменения не растет с размером пачки
+        """
+        def capture(method, data):
+            with CaptureQueriesContext(connection) as queries:
+                response = method(self.url, data, format='json')
+            self.assertLess(response.status_code, 300)
+            return [query['sql'] for query in queries]
+
+        def new_habits(count):
+            return [{'place': 'Park', 'time': '07:00:00', 'action': f'Action {i}', 'time_to_complete': 30,
+                     'periodicity': 1} for i in range(count)]
+
+        self.assertEqual(len(capture(self.client.post, new_habits(1))), len(capture(self.client.post, new_habits(50))))
+
+        habits = Habits.objects.filter(owner=self.user).order_by('id')
+        single = capture(self.client.patch, [{'id': habits[0].id, 'action': 'New'}])
+        queries = capture(self.client.patch, [{'id': habit.id, 'action': 'New'} for habit in habits[:50]])
+        self.assertEqual(len(queries), len(single))
+        update = [sql for sql in queries if sql.startswith('UPDATE')][0]
+        self.assertNotIn('"owner_id"', update)
+        self.assertNotIn('"place"', update)
+
+    def test_bulk_update_validates_whole_habit(self):
+        """
+        Проверяем, что при частичном изменении проверки учитывают непереданные поля привычки
+        """
+        habit = Habits.objects.create(owner=self.user, place='Home', time='20:00:00', action='Bath',
+                                      time_to_complete=30, is_pleasant_habit=True)
+        response = self.client.patch(self.url, [{'id': habit.id, 'reward': 'Cake'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update_foreign_habit(self):
+        habit = self.create_habit(self.other, 'Jogging')
+        response = self.client.patch(self.url, [{'id': habit.id, 'action': 'Stolen'}], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data, {'not_found': [habit.id]})
+
+    def test_bulk_delete(self):
+        own = self.create_habit(self.user, 'Jogging')
+        foreign = self.create_habit(self.other, 'Workout')
+        response = self.client.delete(self.url, {'ids': [own.id, foreign.id]}, format='json')
+
+        self.assertEqual(response.data, {'deleted': [own.id], 'not_found': [foreign.id]})
+        self.assertEqual(list(Habits.objects.values_list('id', flat=True)), [foreign.id])
+
+    def test_list_multi_get(self):
+        habits = [self.create_habit(self.user, f'Action {i}') for i in range(3)]
+        response = self.client.get(reverse('habits:habits_list'), {'ids': f'{habits[0].id},{habits[2].id}'})
+        self.assertEqual([habit['id'] for habit in response.data['results']], [habits[0].id, habits[2].id])
+
+        response = self.client.get(reverse('habits:habits_list'), {'ids': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class HabitReadSerializerTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='read@example.com')
+        self.pleasant = Habits.objects.create(owner=self.user, place='Home', time='20:00:00', action='Bath',
+                                              time_to_complete=30, is_pleasant_habit=True)
+        self.habit = Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action='Jogging',
+                                           time_to_complete=30, is_pleasant_habit=False,
+                                           related_habit=self.pleasant)
+        self.url = reverse('habits:pablichabit_list')
+
+    def test_same_output_as_model_serializer(self):
+        habits = Habits.objects.order_by('id')
+        self.assertEqual(HabitsReadSerializer(habits, many=True).data, HabitsSerializer(habits, many=True).data)
+
+    def test_sparse_fields(self):
+        """
+        Проверяем, что ?fields= сужает и ответ, и список колонок в запросе
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'fields': 'id,action'})
+
+        self.assertEqual(response.data['results'][0], {'id': self.pleasant.id, 'action': 'Bath'})
+        select = [q['sql'] for q in queries if 'FROM "habits_habits"' in q['sql'] and 'COUNT' not in q['sql']][0]
+        self.assertNotIn('"place"', select)
+
+        response = self.client.get(self.url, {'fields': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expand_related_habit(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'fields': 'id,action,related_habit', 'expand': 'related_habit'})
+
+        self.assertEqual(response.data['results'][1]['related_habit'],
+                         {'id': self.pleasant.id, 'action': 'Bath', 'related_habit': None})
+        # подсчет количества и одна выборка привычек вместе со связанными
+        self.assertEqual(len(queries), 2)
+
+    def test_expand_private_related_habit(self):
+        """
+        Проверяем, что публичный список не раскрывает чужую приватную связанную привычку
+        """
+        self.pleasant.is_public = False
+        self.pleasant.save()
+        response = self.client.get(self.url, {'fields': 'id,action,related_habit', 'expand': 'related_habit'})
+        self.assertEqual(response.data['results'], [
+            {'id': self.habit.id, 'action': 'Jogging', 'related_habit': self.pleasant.id},
+        ])
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('habits:habits_list'),
+                                   {'fields': 'id,action,related_habit', 'expand': 'related_habit'})
+        self.assertEqual(response.data['results'][1]['related_habit'],
+                         {'id': self.pleasant.id, 'action': 'Bath', 'related_habit': None})
+
+
+class HabitSearchAPIViewTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='search@example.com')
+        self.other = User.objects.create(email='search-other@example.com')
+        self.url = reverse('habits:habit_search')
+        self.public = [
+            Habits.objects.create(owner=self.other, place='Park', time='07:00:00', action=f'Morning run {i}',
+                                  time_to_complete=30, is_public=True)
+            for i in range(7)
+        ]
+        Habits.objects.create(owner=self.other, place='Gym', time='08:00:00', action='Workout',
+                              time_to_complete=30, is_public=True)
+        self.private = Habits.objects.create(owner=self.user, place='Home', time='09:00:00', action='Evening run',
+                                             time_to_complete=30, is_public=False)
+
+    def test_search_public_with_cursor(self):
+        """
+        Проверяем, что поиск находит привычки по действию и отдает их страницами по курсору
+        """
+        response = self.client.get(self.url, {'q': 'run'})
+        ids = [habit['id'] for habit in response.data['results']]
+        response = self.client.get(response.data['next'])
+        ids += [habit['id'] for habit in response.data['results']]
+
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(ids, [habit.id for habit in self.public])
+
+    def test_search_own(self):
+        response = self.client.get(self.url, {'q': 'home', 'scope': 'own'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url, {'q': 'run', 'scope': 'own'})
+        self.assertEqual([habit['id'] for habit in response.data['results']], [self.private.id])
+
+    def test_search_requires_query(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnless(connection.vendor == 'postgresql', 'ранжирование есть только в PostgreSQL')
+    def test_cursor_with_real_rank(self):
+        """
+        Проверяем, что курсор по рангу (real в PostgreSQL) проходит все результаты без повторов и пропусков,
+        в том числе при одинаковом ранге
+        """
+        habits = self.public + [
+            Habits.objects.create(owner=self.other, place='Park', time='10:00:00', action=f'Morning run {i}',
+                                  time_to_complete=30, is_public=True)
+            for i in range(7)
+        ]
+        ids = []
+        response = self.client.get(self.url, {'q': 'morning run'})
+        while True:
+            ids += [habit['id'] for habit in response.data['results']]
+            if not response.data['next'] or len(ids) > len(habits):
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(sorted(ids), sorted(habit.id for habit in habits))
+
+
+@override_settings(HABITS_EXPORT_CHUNK_SIZE=2)
+class HabitExportAPIViewTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='export@example.com')
+        other = User.objects.create(email='export-other@example.com')
+        self.habits = [
+            Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action=f'Action {i}',
+                                  time_to_complete=30)
+            for i in range(5)
+        ]
+        Habits.objects.create(owner=other, place='Gym', time='08:00:00', action='Workout', time_to_complete=30)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('habits:habit_export')
+
+    def test_export_ndjson(self):
+        """
+        Проверяем, что выгрузка отдается потоком по пачкам и содержит только привычки пользователя
+        """
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual([row['id'] for row in rows], [habit.id for habit in self.habits])
+        self.assertEqual(rows[0]['time'], '07:00:00')
+        self.assertEqual(rows[0]['owner'], self.user.id)
+
+    def test_export_csv_gzip(self):
+        response = self.client.get(self.url, {'type': 'csv', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('habits.csv.gz', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()))
+        self.assertEqual([int(row['id']) for row in rows], [habit.id for habit in self.habits])
+        self.assertEqual(rows[-1]['action'], 'Action 4')
+
+    async def test_export_async_stream(self):
+        """
+        Проверяем, что под ASGI выгрузка отдается асинхронным потоком, а не собирается в память
+        """
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Bearer {token}'})
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(b''.join(chunks).splitlines()), 5)
+
+    def test_export_unknown_type(self):
+        response = self.client.get(self.url, {'type': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportHabitsCommandTest(TestCase):
+
+    def test_import_habits_csv(self):
+        """
+        Проверяем, что корректные строки загружаются, а строки с ошибками пропускаются с номером строки
+        """
+        owner = User.objects.create(email='import@example.com')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write('owner,owner_email,place,time,action,is_pleasant_habit,periodicity,reward,time_to_complete\n'
+                       f'{owner.id},,Park,7:00,Jogging,false,2,Cake,30\n'
+                       ',import@example.com,Home,21:30:00,Reading,true,,,60\n'
+                       f'{owner.id},,Gym,08:00,Workout,false,1,,500\n'
+                       ',missing@example.com,Park,07:00,Walk,true,1,,10\n'
+                       f'{owner.id},,Home,25:00,Sleep,true,1,,10\n')
+            file.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_habits', file.name, batch_size=2, stdout=out, stderr=err)
+
+        self.assertIn('Загружено: 2, пропущено: 3', out.getvalue())
+        self.assertIn('Строка 4: Время выполнения должно быть не больше 120 секунд', err.getvalue())
+        self.assertIn('Строка 5: владелец не найден', err.getvalue())
+        self.assertIn('Строка 6: некорректное время', err.getvalue())
+        habit = Habits.objects.get(action='Jogging')
+        self.assertEqual((habit.time, habit.periodicity, habit.is_pleasant_habit), (time(7, 0), 2, False))
+        self.assertIsNotNone(habit.next_run_at)
+        self.assertEqual(Habits.objects.get(action='Reading').owner, owner)
+
+
+class HabitCompletionTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='complete@example.com', telegram_id='100')
+        self.other = User.objects.create(email='complete-other@example.com', telegram_id='200')
+        self.habit = Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action='Jogging',
+                                           time_to_complete=30, periodicity=2)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('habits:habit_complete', args=[self.habit.id])
+        self.today = timezone.localdate()
+
+    def test_complete_endpoint(self):
+        """
+        Проверяем, что отметка возвращает счетчики, а повторная отметка за тот же день их не меняет
+        """
+        response = self.client.post(self.url, {'completed_on': self.today - timedelta(days=2)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json(), {'id': self.habit.id, 'current_streak': 2, 'best_streak': 2,
+                                           'total_completions': 2, 'last_completed_on': self.today.isoformat()})
+
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['total_completions'], 2)
+        self.assertEqual(HabitCompletion.objects.filter(habit=self.habit).count(), 2)
+
+        response = self.client.post(self.url, {'completed_on': self.today + timedelta(days=1)})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(self.other)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_streaks(self):
+        """
+        Проверяем, что серия прерывается при перерыве дольше периодичности,
+        а отметка задним числом пересчитывает серии по истории
+        """
+        start = self.today - timedelta(days=10)
+        for days in (0, 2, 5, 6):
+            habit, created = complete_habit(self.habit.id, start + timedelta(days=days))
+        self.assertEqual((habit.current_streak, habit.best_streak, habit.total_completions), (2, 2, 4))
+
+        habit, created = complete_habit(self.habit.id, start + timedelta(days=4))
+        self.assertTrue(created)
+        self.assertEqual((habit.current_streak, habit.best_streak, habit.total_completions), (0, 5, 5))
+        self.assertEqual(habit.last_completed_on, start + timedelta(days=6))
+
+    def test_reset_broken_streaks(self):
+        complete_habit(self.habit.id, self.today - timedelta(days=3))
+        complete_habit(self.habit.id, self.today - timedelta(days=2))
+        fresh = Habits.objects.create(owner=self.user, place='Gym', time='08:00:00', action='Workout',
+                                      time_to_complete=30, periodicity=1)
+        complete_habit(fresh.id, self.today)
+
+        self.assertEqual(reset_broken_streaks(), 0)
+        Habits.objects.filter(id=self.habit.id).update(periodicity=1)
+        self.assertEqual(reset_broken_streaks(), 1)
+        self.habit.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((self.habit.current_streak, self.habit.best_streak), (0, 2))
+        self.assertEqual(fresh.current_streak, 1)
+
+    def test_telegram_callback_completes_habit(self):
+        """
+        Проверяем, что кнопка в напоминании отмечает выполнение только для владельца привычки
+        """
+        updates = [
+            {'update_id': 1, 'callback_query': {'id': 'a', 'from': {'id': 100}, 'data': f'complete:{self.habit.id}'}},
+            {'update_id': 2, 'callback_query': {'id': 'b', 'from': {'id': 200}, 'data': f'complete:{self.habit.id}'}},
+        ]
+        TelegramUpdate.objects.bulk_create([TelegramUpdate(update_id=u['update_id'], payload=u) for u in updates])
+        with patch('habits.tasks.session') as session:
+            self.assertEqual(process_telegram_updates(), 2)
+
+        self.habit.refresh_from_db()
+        self.assertEqual((self.habit.current_streak, self.habit.last_completed_on), (1, self.today))
+        answers = [call.kwargs['data'] for call in session.post.call_args_list]
+        self.assertEqual(answers, [{'callback_query_id': 'a', 'text': 'Выполнено! Серия: 1'},
+                                   {'callback_query_id': 'b', 'text': 'Привычка не найдена'}])
+
+
+class HabitOwnershipTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='owner@example.com')
+        self.other = User.objects.create(email='stranger@example.com')
+        self.habit = Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action='Jogging',
+                                           time_to_complete=30, periodicity=1)
+        self.client.force_authenticate(self.other)
+
+    def test_other_user_habit_not_found(self):
+        """
+        Проверяем, что чужая привычка недоступна и не изменяется
+        """
+        pk = self.habit.pk
+        self.assertEqual(self.client.get(reverse('habits:habit_detail', args=[pk])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        response = self.client.patch(reverse('habits:habit_update', args=[pk]), {'action': 'Swimming'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.delete(reverse('habits:habit_delete', args=[pk])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.action, 'Jogging')
+
+    def test_patch_updates_changed_columns(self):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(reverse('habits:habit_update', args=[self.habit.pk]), {'action': 'Swimming'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"action"', updates[0])
+        self.assertNotIn('"place"', updates[0])
+
+        response = self.client.delete(reverse('habits:habit_delete', args=[self.habit.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Habits.objects.filter(pk=self.habit.pk).exists())
+
+    def test_destroy_queries(self):
+        """
+        Проверяем, что удаление загружает только нужные поля привычки и не выполняет лишних запросов
+        """
+        self.client.force_authenticate(self.user)
+        url = reverse('habits:habit_delete', args=[self.habit.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        statements = [q['sql'] for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+        self.assertEqual(len(statements), 5)
+        self.assertNotIn('"place"', statements[0])
+
+
+class StaticFilesTest(TestCase):
+
+    def test_asgi_serves_static(self):
+        """
+        Проверяем, что приложение под uvicorn само отдает статику админки
+        """
+        from config.asgi import application
+
+        async def get(path):
+            communicator = ApplicationCommunicator(application, {
+                'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': []})
+            await communicator.send_input({'type': 'http.request'})
+            return await communicator.receive_output(timeout=5)
+
+        response = asyncio.run(get('/static/admin/css/base.css'))
+        self.assertEqual(response['status'], 200)
+
+
+class HabitAsyncViewsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='async@example.com', is_staff=True)
+        for i in range(7):
+            Habits.objects.create(owner=self.user, place='Park', time='07:00:00', action=f'Action {i}',
+                                  time_to_complete=30, periodicity=1, is_public=i % 2 == 0)
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        cache.clear()
+
+    async def test_async_views(self):
+        """
+        Проверяем ответы асинхронных представлений при вызове из цикла событий
+        """
+        response = await self.async_client.get(reverse('habits:habits_list'), headers=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 7)
+        self.assertEqual(len(response.json()['results']), 5)
+
+        response = await self.async_client.get(reverse('habits:habits_list'), {'pagination': 'cursor'},
+                                               headers=self.auth)
+        self.assertIsNotNone(response.json()['next'])
+
+        response = await self.async_client.get(reverse('habits:pablichabit_list'), {'fields': 'id,action'})
+        self.assertEqual(response.json()['count'], 4)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'action'})
+
+        habit = await Habits.objects.afirst()
+        response = await self.async_client.get(reverse('habits:habit_detail', args=[habit.id]), headers=self.auth)
+        self.assertEqual(response.json()['action'], habit.action)
+        response = await self.async_client.get(reverse('habits:habit_detail', args=[habit.id]),
+                                               headers={**self.auth, 'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = await self.async_client.get(reverse('users:user_retrieve', args=[self.user.id]),
+                                               headers=self.auth)
+        self.assertEqual(response.json()['email'], 'async@example.com')
+        response = await self.async_client.get(reverse('habits:habit_detail', args=[habit.id]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_views_are_async(self):
+        for view in (HabitListAPIView, PublicHabitListAPIView, HabitRetrieveAPIView):
+            self.assertTrue(view.view_is_async)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        # вместо сокета временный файл
+        self.file = tempfile.TemporaryFile()
+        self.closed_file = None
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        if not self.closed:
+            stat = os.fstat(self.file.fileno())
+            self.closed_file = (stat.st_dev, stat.st_ino)
+            self.file.close()
+        self.closed = 1
+
+
+class ConnectionPoolTest(TestCase):
+
+    def test_reuse_and_limit(self):
+        """
+        Возвращенное соединение выдается снова, больше max_size соединений не открывается
+        """
+        pool = ConnectionPool(FakeConnection, max_size=2, timeout=0)
+        first, second = pool.getconn(), pool.getconn()
+        with self.assertRaises(OperationalError):
+            pool.getconn()
+
+        first.status = extensions.TRANSACTION_STATUS_INTRANS
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(first.status, extensions.TRANSACTION_STATUS_IDLE)
+
+        second.close()
+        pool.putconn(second)
+        self.assertEqual(pool.size, 1)
+        self.assertIsNot(pool.getconn(), second)
+
+    def test_idle_timeout(self):
+        """
+        Простаивающие соединения сверх min_size закрываются, сломанные заменяются новыми
+        """
+        pool = ConnectionPool(FakeConnection, min_size=1, max_size=3, max_idle=0, check_interval=60)
+        connections = [pool.getconn() for _ in range(3)]
+        for item in connections:
+            pool.putconn(item)
+        connection = pool.getconn()
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(sum(item.closed for item in connections), 2)
+
+        pool.putconn(connection)
+        connection.close()
+        self.assertIsNot(pool.getconn(), connection)
+        self.assertEqual(pool.size, 1)
+
+    def test_close_pool(self):
+        """
+        Проверяем, что закрытый пул закрывает простаивающие соединения и возвращаемые позже
+        """
+        pool = ConnectionPool(FakeConnection, min_size=2)
+        idle, used = pool.getconn(), pool.getconn()
+        pool.putconn(idle)
+        pool.close()
+        self.assertTrue(idle.closed)
+        pool.putconn(used)
+        self.assertTrue(used.closed)
+        self.assertEqual(pool.size, 0)
+
+    def test_abandon_after_fork(self):
+        """
+        Проверяем, что после fork унаследованное соединение закрывается без отправки серверу завершения:
+        libpq закрывает дескриптор один раз, и он уже указывает на /dev/null
+        """
+        pool = ConnectionPool(FakeConnection)
+        connection = pool.getconn()
+        with patch('config.postgresql_pool.pool.os.getpid', return_value=pool.pid + 1):
+            pool.putconn(connection)
+        devnull = os.stat(os.devnull)
+        self.assertEqual(connection.closed_file, (devnull.st_dev, devnull.st_ino))
+
+
+class OpenAPISchemaTest(TestCase):
+
+    def setUp(self):
+        schema_module.schema = None
+        self.addCleanup(setattr, schema_module, 'schema', None)
+
+    def test_schema_served_from_memory(self):
+        """
+        Схема генерируется один раз и отдается с ETag и Cache-Control
+        """
+        with override_settings(OPENAPI_SCHEMA_PATH='/nonexistent/openapi.json'), \
+                patch('config.schema.generate_schema', wraps=schema_module.generate_schema) as generate:
+            response = self.client.get(reverse('schema-json'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('/habits/create/', response.json()['paths'])
+            self.assertIn('max-age=3600', response['Cache-Control'])
+
+            response = self.client.get(reverse('schema-json'), headers={'If-None-Match': response['ETag']})
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(generate.call_count, 1)
+
+        response = self.client.get(reverse('schema-swagger-ui'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, 'swagger.json')
+
+    def test_generate_schema_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/openapi.json'
+            call_command('generate_schema', path=path, stdout=StringIO())
+            with override_settings(OPENAPI_SCHEMA_PATH=path), patch('config.schema.generate_schema') as generate:
+                response = self.client.get(reverse('schema-json'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('paths', response.json())
+            generate.assert_not_called()
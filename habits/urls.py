@@ -1,7 +1,8 @@
 from habits.apps import HabitsConfig
 from django.urls import path
 from habits.views import HabitCreateAPIView, HabitListAPIView, HabitRetrieveAPIView, HabitUpdateAPIView, \
-    HabitDestroyAPIView, PublicHabitListAPIView
+    HabitDestroyAPIView, PublicHabitListAPIView, HabitBulkAPIView, HabitSearchAPIView, \
+    HabitExportAPIView, HabitCompleteAPIView
 
 app_name = HabitsConfig.name
 
@@ -12,4 +13,8 @@ urlpatterns = [
     path('view/<int:pk>',HabitRetrieveAPIView.as_view(),name='habit_detail'),
     path('edit/<int:pk>',HabitUpdateAPIView.as_view(),name='habit_update'),
     path('delete/<int:pk>',HabitDestroyAPIView.as_view(),name='habit_delete'),
+    path('bulk/',HabitBulkAPIView.as_view(),name='habit_bulk'),
+    path('search/',HabitSearchAPIView.as_view(),name='habit_search'),
+    path('export/',HabitExportAPIView.as_view(),name='habit_export'),
+    path('complete/<int:pk>',HabitCompleteAPIView.as_view(),name='habit_complete'),
 ]
\ No newline at end of file
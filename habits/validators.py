@@ -16,7 +16,8 @@ class TimeCompleteValidator:
         self.field = field
 
     def __call__(self, habit):
-        if habit.get('time_to_complete') > 120:
+        # при частичном изменении поля может не быть в запросе
+        if habit.get('time_to_complete') is not None and habit.get('time_to_complete') > 120:
             raise ValidationError('Время выполнения должно быть не больше 120 секунд')
 
 
@@ -49,5 +50,5 @@ class PeriodicityValidator:
         self.field = field
 
     def __call__(self, habit):
-        if habit.get('periodicity') < 1 or habit.get('periodicity') > 7:
+        if habit.get('periodicity') is not None and not 1 <= habit.get('periodicity') <= 7:
             raise ValidationError('Нельзя выполнять привычку реже, чем 1 раз в 7 дней')
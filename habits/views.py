@@ -1,12 +1,118 @@
-from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView, UpdateAPIView, DestroyAPIView
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+import hmac
+from functools import cached_property
 
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.generics import CreateAPIView, ListAPIView, UpdateAPIView, DestroyAPIView
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.exceptions import NotAuthenticated, NotFound, ValidationError
+from rest_framework.views import APIView
+
+from habits.cache import CachedResponseMixin
+from habits.completions import STREAK_FIELDS, complete_habit
+from habits.export import EXPORT_FORMATS, aiter_chunks, iter_batches, iter_gzip
+from habits.metrics import render_metrics
 from habits.models import Habits
-from habits.pagination import HabitPagination
-from habits.serializer import HabitsSerializer
+from habits.pagination import HabitPagination, HabitSearchPagination
+from habits.search import search_habits
+from habits.serializer import EXPANDABLE_FIELDS, HABIT_FIELDS, HabitCompletionSerializer, HabitsBulkSerializer, \
+    HabitsReadSerializer, HabitsSerializer
+from habits.tasks import save_updates
+from users.async_views import AsyncListAPIView, AsyncRetrieveAPIView
+from users.conditional import conditional_get
 from users.permissions import IsOwner
 
 
+def get_habit_list_state(request, *args, **kwargs):
+    """
+    Время последнего изменения и количество привычек в списке пользователя.
+    Удаление меняет количество, поэтому список проверяется только по ETag
+    """
+    user = request.user
+    queryset = Habits.objects.all() if user.is_superuser else Habits.objects.filter(owner=user)
+    state = queryset.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return state['last_modified'], state['count']
+
+
+def get_ids(value):
+    """
+    Список id из параметра вида 1,2,3 или из массива в теле запроса
+    """
+    if isinstance(value, str):
+        value = value.split(',') if value else []
+    if not isinstance(value, list):
+        raise ValidationError({'ids': 'Ожидается список id'})
+    try:
+        ids = [int(pk) for pk in value]
+    except (TypeError, ValueError):
+        raise ValidationError({'ids': 'Ожидается список целых чисел'})
+    if len(ids) > settings.HABITS_BULK_MAX_SIZE:
+        raise ValidationError({'ids': f'Не больше {settings.HABITS_BULK_MAX_SIZE} id за запрос'})
+    return ids
+
+
+def get_owned_habits(user):
+    """
+    Привычки, доступные пользователю для просмотра и изменения: свои, а персоналу - все.
+    Проверка владельца выполняется в запросе (индекс owner, id), чужая привычка не загружается
+    """
+    return Habits.objects.all() if user.is_staff else Habits.objects.filter(owner=user)
+
+
+def get_habit_state(request, pk):
+    updated_at = get_owned_habits(request.user).filter(pk=pk).values_list('updated_at', flat=True).first()
+    return None if updated_at is None else (updated_at, pk)
+
+
+class HabitReadMixin:
+    """
+    Быстрая сериализация списков привычек через HabitsReadSerializer.
+    ?fields=id,action - выводимые поля, выборка из базы сужается через only();
+    ?expand=related_habit - связанная привычка выводится объектом и загружается тем же запросом.
+    Объектом выводятся только привычки, которые разрешает can_expand, у остальных - id
+    """
+
+    @cached_property
+    def read_params(self):
+        params = self.request.query_params
+        fields = tuple(field for field in params.get('fields', '').split(',') if field) or HABIT_FIELDS
+        expand = tuple(field for field in params.get('expand', '').split(',') if field)
+        if set(fields) - set(HABIT_FIELDS):
+            raise ValidationError({'fields': f'Допустимые поля: {", ".join(HABIT_FIELDS)}'})
+        if set(expand) - set(EXPANDABLE_FIELDS):
+            raise ValidationError({'expand': f'Допустимые связи: {", ".join(EXPANDABLE_FIELDS)}'})
+        return fields, expand
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields, expand = self.read_params
+        # id и time нужны пагинации по курсору
+        columns = {'id', 'time', *fields}
+        if 'related_habit' in expand:
+            queryset = queryset.select_related('related_habit')
+            columns.update(('related_habit', 'related_habit__is_public', 'related_habit__owner',
+                            *(f'related_habit__{field}' for field in fields)))
+        return queryset.only(*columns)
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.read_params
+        return HabitsReadSerializer(*args, fields=fields, expand=expand, can_expand=self.can_expand, **kwargs)
+
+    def can_expand(self, related_habit):
+        """
+        Связанная привычка видна, если она публичная, своя или пользователь - администратор
+        """
+        user = self.request.user
+        return related_habit.is_public or user.is_superuser or (
+            user.is_authenticated and related_habit.owner_id == user.id)
+
+
 class HabitCreateAPIView(CreateAPIView):
     """
     Эндпоинт для создания привычки
@@ -18,9 +124,9 @@ class HabitCreateAPIView(CreateAPIView):
         new_habit = serializer.save()
 
 
-class HabitListAPIView(ListAPIView):
+class HabitListAPIView(HabitReadMixin, CachedResponseMixin, AsyncListAPIView):
     """
-    Эндпоинт для вывода списка привычек
+    Эндпоинт для вывода списка привычек (асинхронный)
     """
     serializer_class = HabitsSerializer
     pagination_class = HabitPagination
@@ -32,39 +138,258 @@ class HabitListAPIView(ListAPIView):
             queryset = Habits.objects.filter(owner=user)
         else:
             queryset = Habits.objects.all()
-        return queryset
+        if 'ids' in self.request.query_params:
+            queryset = queryset.filter(id__in=get_ids(self.request.query_params['ids']))
+        return queryset.order_by('id')
 
+    def get_cache_scope(self):
+        user = self.request.user
+        return None if user.is_superuser else f'owner:{user.id}'
 
-class PublicHabitListAPIView(ListAPIView):
+    @conditional_get(get_habit_list_state, last_modified=False)
+    async def get(self, request, *args, **kwargs):
+        return await super().get(request, *args, **kwargs)
+
+    async def list(self, request, *args, **kwargs):
+        return await self.acached_response(super().list, request, *args, **kwargs)
+
+
+class PublicHabitListAPIView(HabitReadMixin, CachedResponseMixin, AsyncListAPIView):
     """
-    Эндпоинт для вывода списка публичных привычек
+    Эндпоинт для вывода списка публичных привычек (асинхронный)
     """
     serializer_class = HabitsSerializer
-    queryset = Habits.objects.filter(is_public=True)
+    queryset = Habits.objects.filter(is_public=True).order_by('id')
     pagination_class = HabitPagination
 
+    def get_cache_scope(self):
+        return 'public'
+
+    def can_expand(self, related_habit):
+        # ответ кэшируется общим для всех пользователей, поэтому раскрываются только публичные привычки
+        return related_habit.is_public
+
+    async def list(self, request, *args, **kwargs):
+        return await self.acached_response(super().list, request, *args, **kwargs)
+
+
+class HabitSearchAPIView(HabitReadMixin, ListAPIView):
+    """
+    Эндпоинт для поиска привычек по действию и месту.
+    ?q= - текст запроса, ?scope=public (по умолчанию) - среди публичных привычек, own - среди своих.
+    Результаты упорядочены по релевантности и выдаются с пагинацией по курсору
+    """
+    pagination_class = HabitSearchPagination
+
+    def get_queryset(self):
+        text = self.request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'Укажите текст для поиска'})
+
+        scope = self.request.query_params.get('scope', 'public')
+        if scope == 'public':
+            queryset = Habits.objects.filter(is_public=True)
+        elif scope == 'own':
+            if not self.request.user.is_authenticated:
+                raise NotAuthenticated()
+            queryset = Habits.objects.filter(owner=self.request.user)
+        else:
+            raise ValidationError({'scope': 'Допустимые значения: public, own'})
+        return search_habits(queryset, text)
+
 
-class HabitRetrieveAPIView(RetrieveAPIView):
+class HabitRetrieveAPIView(CachedResponseMixin, AsyncRetrieveAPIView):
     """
-    Эндпоинт для просмотра одной привычки
+    Эндпоинт для просмотра одной привычки (асинхронный)
     """
     serializer_class = HabitsSerializer
-    queryset = Habits.objects.all()
-    permission_classes = [IsAuthenticated, IsAdminUser | IsOwner]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return get_owned_habits(self.request.user)
+
+    def get_cache_scope(self):
+        return f'habit:{self.kwargs["pk"]}'
+
+    def get_cache_vary(self):
+        # набор доступных привычек зависит от пользователя
+        return f'{self.request.user.id}:{self.request.user.is_staff}'
+
+    @conditional_get(get_habit_state)
+    async def get(self, request, *args, **kwargs):
+        return await super().get(request, *args, **kwargs)
+
+    async def retrieve(self, request, *args, **kwargs):
+        return await self.acached_response(super().retrieve, request, *args, **kwargs)
 
 
 class HabitUpdateAPIView(UpdateAPIView):
     """
-    Эндпоинт для обновления или изменения привычки
+    Эндпоинт для обновления или изменения привычки.
+    Записываются только переданные поля, см. HabitsSerializer.update
     """
     serializer_class = HabitsSerializer
-    queryset = Habits.objects.all()
-    permission_classes = [IsAuthenticated, IsAdminUser | IsOwner]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return get_owned_habits(self.request.user)
 
 
 class HabitDestroyAPIView(DestroyAPIView):
     """
-    Эндпоинт для удаления привычки
+    Эндпоинт для удаления привычки: права проверяются условием с владельцем в запросе, 404 если привычки нет
+    или она чужая. Django загружает удаляемую привычку (только поля для сигнала сброса кэша), удаляет ее
+    отметки выполнения и напоминания, обнуляет ссылки related_habit и удаляет саму привычку - 5 запросов
     """
-    queryset = Habits.objects.all()
-    permission_classes = [IsAuthenticated, IsAdminUser | IsOwner]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return get_owned_habits(self.request.user)
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            deleted, _ = self.get_queryset().filter(pk=kwargs['pk']).only('id', 'owner', 'is_public').delete()
+        if not deleted:
+            raise NotFound()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class HabitBulkAPIView(APIView):
+    """
+    Эндпоинт для пакетной работы с привычками: POST - создание, PATCH - изменение
+    (у каждой привычки указывается id), DELETE - удаление по списку ids.
+    Все привычки проверяются по правилам HabitsSerializer и записываются в одной транзакции,
+    число запросов не зависит от размера пачки (см. HabitsBulkSerializer)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        if not user.is_superuser:
+            return Habits.objects.filter(owner=user)
+        return Habits.objects.all()
+
+    def get_serializer(self, *args, **kwargs):
+        return HabitsBulkSerializer(*args, many=True, max_length=settings.HABITS_BULK_MAX_SIZE, **kwargs)
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': 'Ожидается список привычек'})
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save(owner=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        if not isinstance(request.data, list) or not all(isinstance(item, dict) for item in request.data):
+            raise ValidationError({'non_field_errors': 'Ожидается список привычек'})
+        ids = get_ids([item.get('id') for item in request.data])
+        if len(set(ids)) != len(ids):
+            raise ValidationError({'ids': 'Привычки в запросе повторяются'})
+
+        with transaction.atomic():
+            habits = self.get_queryset().select_for_update().in_bulk(ids)
+            not_found = [pk for pk in ids if pk not in habits]
+            if not_found:
+                return Response({'not_found': not_found}, status=status.HTTP_404_NOT_FOUND)
+
+            # записываются только переданные поля, владелец привычки не меняется
+            serializer = self.get_serializer([habits[pk] for pk in ids], data=request.data, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return Response(serializer.data)
+
+    def delete(self, request):
+        ids = get_ids(request.data.get('ids') if isinstance(request.data, dict) and 'ids' in request.data
+                      else request.query_params.get('ids', ''))
+        with transaction.atomic():
+            queryset = self.get_queryset().filter(id__in=ids)
+            deleted = set(queryset.values_list('id', flat=True))
+            queryset.delete()
+        return Response({'deleted': [pk for pk in ids if pk in deleted],
+                         'not_found': [pk for pk in ids if pk not in deleted]})
+
+
+class HabitCompleteAPIView(APIView):
+    """
+    Эндпоинт для отметки выполнения привычки за день (completed_on, по умолчанию сегодня).
+    Возвращает счетчики серии, повторная отметка за тот же день их не меняет
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        user = request.user
+        queryset = Habits.objects.all() if user.is_superuser else Habits.objects.filter(owner=user)
+        get_object_or_404(queryset.only('id'), pk=pk)
+        serializer = HabitCompletionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        habit, created = complete_habit(pk, serializer.validated_data.get('completed_on'))
+        return Response({'id': habit.pk, **{field: getattr(habit, field) for field in STREAK_FIELDS}},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+class HabitExportAPIView(APIView):
+    """
+    Эндпоинт для выгрузки всех привычек пользователя (администратору - всех привычек) потоком.
+    ?type=ndjson (по умолчанию) или csv, ?gzip=1 - сжатый файл
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type not in EXPORT_FORMATS:
+            raise ValidationError({'type': f'Допустимые форматы: {", ".join(EXPORT_FORMATS)}'})
+        render, content_type = EXPORT_FORMATS[export_type]
+
+        user = request.user
+        queryset = Habits.objects.all() if user.is_superuser else Habits.objects.filter(owner=user)
+        content = render(iter_batches(queryset, settings.HABITS_EXPORT_CHUNK_SIZE))
+        filename = f'habits.{export_type}'
+        if request.query_params.get('gzip') in ('1', 'true'):
+            content, content_type, filename = iter_gzip(content), 'application/gzip', f'{filename}.gz'
+
+        if isinstance(request._request, ASGIRequest):
+            content = aiter_chunks(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class TelegramWebhookAPIView(APIView):
+    """
+    Эндпоинт для приема обновлений Telegram через webhook.
+    Обновления сохраняются в очередь и обрабатываются пачками задачей process_telegram_updates
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        # без секрета любой мог бы отправить поддельные обновления, поэтому webhook выключен
+        secret = settings.TELEGRAM_WEBHOOK_SECRET
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not secret or not hmac.compare_digest(token.encode(), secret.encode()):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        if 'update_id' not in request.data:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        save_updates([request.data])
+        return Response(status=status.HTTP_200_OK)
+
+
+class MetricsAPIView(APIView):
+    """
+    Эндпоинт с метриками отправки напоминаний в формате Prometheus.
+    Доступен только с заголовком Authorization: Bearer <METRICS_TOKEN>
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        header = request.headers.get('Authorization', '')
+        if not token or not hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        body, content_type = render_metrics()
+        return HttpResponse(body, content_type=content_type)
@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import User
+
+# поля, которые читают аутентификация и проверки прав; остальные поля загружаются из базы при обращении
+AUTH_FIELDS = ('id', 'email', 'is_active', 'is_staff', 'is_superuser')
+USER_VERSION_KEY = 'users:version:{}'
+USER_KEY = 'users:auth:{}:{}'
+
+
+class LocalCache:
+    """
+    LRU кэш в памяти процесса с коротким временем жизни записей
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.timeout, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+
+local_users = LocalCache(settings.USERS_AUTH_LOCAL_SIZE, settings.USERS_AUTH_LOCAL_TIMEOUT)
+
+
+def is_shared_cache():
+    """
+    Кэш общий для всех процессов. Кэш в памяти процесса не видит смену версии пользователя
+    в других процессах, и они отдавали бы старые is_staff и is_active до USERS_AUTH_CACHE_TIMEOUT
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_user_version(user_id):
+    key = USER_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_user_version(user_id):
+    """
+    Меняет версию пользователя: закэшированные данные перестают читаться и истекают сами.
+    Другие процессы могут отдавать старые данные из своего LRU не дольше USERS_AUTH_LOCAL_TIMEOUT
+    """
+
+    def bump():
+        cache.set(USER_VERSION_KEY.format(user_id), time.time_ns(), timeout=None)
+        local_users.delete(user_id)
+
+    bump()
+    if connection.in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def get_auth_values(user_id):
+    """
+    Значения AUTH_FIELDS пользователя: из LRU процесса, затем из общего кэша, затем из базы.
+    None - пользователя нет
+    """
+    values = local_users.get(user_id)
+    if values is not None:
+        return values
+
+    key = USER_KEY.format(user_id, get_user_version(user_id))
+    values = cache.get(key)
+    if values is None:
+        values = User.objects.filter(pk=user_id).values_list(*AUTH_FIELDS).first()
+        if values is None:
+            return None
+        values = tuple(values)
+        cache.set(key, values, timeout=settings.USERS_AUTH_CACHE_TIMEOUT)
+    local_users.set(user_id, values)
+    return values
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication без запроса к users_user на каждый запрос: пользователь собирается
+    из закэшированных AUTH_FIELDS. Это экземпляр User с отложенными остальными полями,
+    поэтому фильтры по владельцу и сравнение пользователей работают как раньше.
+    Без общего кэша (CACHE_LOCATION) пользователь читается из базы, как в JWTAuthentication
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN or not is_shared_cache():
+            # для проверки отзыва нужен хэш пароля, который в кэше не хранится
+            return super().get_user(validated_token)
+
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        except (TypeError, ValueError):
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        values = get_auth_values(user_id)
+        if values is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        user = User.from_db(router.db_for_read(User), AUTH_FIELDS, values)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
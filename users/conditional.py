@@ -0,0 +1,52 @@
+import hashlib
+from functools import partial, wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+
+def conditional_get(state_func, last_modified=True):
+    """
+    Декоратор метода get для ответа 304 Not Modified по If-None-Match / If-Modified-Since.
+    state_func(request, *args, **kwargs) одним запросом возвращает пару
+    (время последнего изменения, признак версии) или None, если объекта нет.
+    ETag строится из этой пары без сериализации ответа. Подходит и для async def get.
+    last_modified=False - только ETag: для списков, у которых время последнего изменения
+    уменьшается при удалении самой свежей записи
+    """
+
+    def get_state(request, *args, **kwargs):
+        if not hasattr(request, 'conditional_state'):
+            request.conditional_state = state_func(request, *args, **kwargs)
+        return request.conditional_state
+
+    def get_etag(request, *args, **kwargs):
+        state = get_state(request, *args, **kwargs)
+        if state is None:
+            return None
+        last_modified, version = state
+        # ответ зависит от пользователя (права) и параметров запроса (страница)
+        key = f'{request.user.pk}:{request.get_full_path()}:{version}:{last_modified and last_modified.isoformat()}'
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def get_last_modified(request, *args, **kwargs):
+        state = get_state(request, *args, **kwargs)
+        return state and state[0]
+
+    conditional = condition(etag_func=get_etag, last_modified_func=get_last_modified if last_modified else None)
+
+    def decorator(method):
+        if not iscoroutinefunction(method):
+            return method_decorator(conditional)(method)
+
+        @wraps(method)
+        async def wrapper(self, request, *args, **kwargs):
+            # condition вызывает функции ETag синхронно, поэтому состояние читается заранее
+            if not hasattr(request, 'conditional_state'):
+                request.conditional_state = await sync_to_async(state_func)(request, *args, **kwargs)
+            return await conditional(partial(method, self))(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
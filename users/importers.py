@@ -0,0 +1,228 @@
+import csv
+import gzip
+import io
+import json
+import re
+import secrets
+
+from django.contrib.auth.hashers import identify_hasher
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import User
+
+USER_COLUMNS = ('email', 'password', 'first_name', 'last_name', 'phone', 'city', 'telegram_id', 'telegram_nik')
+# одинаковая проверка почты в SQL и в Python
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+
+def get_import_result():
+    """
+    Итог импорта: imported - загружено строк, skipped - пропущено,
+    errors - первые ошибки в виде пар (номер строки, ошибка)
+    """
+    return {'imported': 0, 'skipped': 0, 'errors': []}
+
+
+def add_import_error(result, line, error, max_errors):
+    result['skipped'] += 1
+    if len(result['errors']) < max_errors:
+        result['errors'].append((line, error))
+
+
+def write_import_result(command, result, elapsed):
+    command.stdout.write(f'Загружено: {result["imported"]}, пропущено: {result["skipped"]}, '
+                         f'время: {elapsed:.1f} с')
+    for line, error in result['errors']:
+        command.stderr.write(f'Строка {line}: {error}')
+
+
+def read_rows(path, file_format=None):
+    """
+    Строки файла CSV (с заголовком) или NDJSON как словари, с номером строки в ключе line.
+    Формат определяется по расширению, файлы .gz распаковываются на лету
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    file_format = file_format or ('csv' if name.endswith('.csv') else 'ndjson')
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as file:
+        if file_format == 'csv':
+            for line, row in enumerate(csv.DictReader(file), start=2):
+                yield {**row, 'line': line}
+        else:
+            for line, text in enumerate(file, start=1):
+                if text.strip():
+                    yield {**{key: _text(value) for key, value in json.loads(text).items()}, 'line': line}
+
+
+def _text(value):
+    # значения NDJSON приводятся к строкам, как в CSV
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+class CopyStream(io.RawIOBase):
+    """
+    Файлоподобный объект для COPY FROM STDIN: строки кодируются в CSV по мере чтения,
+    файл целиком в память не загружается
+    """
+
+    def __init__(self, rows, columns):
+        self.rows = iter(rows)
+        self.columns = columns
+        self.buffer = b''
+        self.text = io.StringIO()
+        self.writer = csv.writer(self.text)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            batch = [next(self.rows, None) for _ in range(1000)]
+            batch = [row for row in batch if row is not None]
+            if not batch:
+                break
+            # пустое значение без кавычек COPY читает как NULL
+            self.writer.writerows([row.get(column) or None for column in self.columns] for row in batch)
+            self.buffer += self.text.getvalue().encode()
+            self.text.seek(0)
+            self.text.truncate()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Загрузка строк во временную таблицу через COPY FROM STDIN (psycopg2)
+    """
+    cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)',
+                       CopyStream(rows, columns))
+
+
+def get_import_password(value):
+    """
+    В базу переносятся только готовые хэши паролей Django. Для остальных строк пароль
+    делается непригодным для входа, хэшировать миллионы паролей при импорте слишком долго
+    """
+    if value:
+        try:
+            identify_hasher(value)
+            return value
+        except ValueError:
+            pass
+    return f'!{secrets.token_urlsafe(30)}'
+
+
+def with_import_passwords(rows):
+    """
+    Пароли строк заменяются по правилу get_import_password до загрузки в базу,
+    чтобы COPY и bulk_create одинаково переносили только хэши известных PASSWORD_HASHERS
+    """
+    for row in rows:
+        yield {**row, 'password': get_import_password(row.get('password'))}
+
+
+def import_users(rows, batch_size=5000, max_errors=100):
+    """
+    Импорт пользователей. Пользователи с уже существующей почтой пропускаются
+    """
+    if connection.vendor == 'postgresql':
+        return _import_users_copy(rows, max_errors)
+    return _import_users_bulk(rows, batch_size, max_errors)
+
+
+def _import_users_copy(rows, max_errors):
+    result = get_import_result()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'''
+            CREATE TEMP TABLE users_import (
+                line bigint, {", ".join(f"{column} text" for column in USER_COLUMNS)}, error text
+            ) ON COMMIT DROP
+        ''')
+        copy_rows(cursor, 'users_import', ('line', *USER_COLUMNS), with_import_passwords(rows))
+        cursor.execute('''
+            UPDATE users_import SET email = trim(email);
+            UPDATE users_import SET error = CASE
+                WHEN email IS NULL OR email !~ %(email_pattern)s THEN 'некорректная почта'
+                WHEN length(email) > 254 THEN 'слишком длинная почта'
+                WHEN length(coalesce(first_name, '')) > 50 OR length(coalesce(last_name, '')) > 50
+                    OR length(coalesce(city, '')) > 50 OR length(coalesce(telegram_id, '')) > 50
+                    OR length(coalesce(telegram_nik, '')) > 50 THEN 'слишком длинное значение'
+                WHEN length(coalesce(phone, '')) > 20 THEN 'слишком длинный телефон'
+            END;
+            UPDATE users_import SET error = 'почта повторяется в файле'
+            WHERE error IS NULL AND line NOT IN (
+                SELECT max(line) FROM users_import WHERE error IS NULL GROUP BY email
+            );
+            UPDATE users_import SET error = 'пользователь с такой почтой уже существует'
+            WHERE error IS NULL AND email IN (SELECT email FROM users_user);
+        ''', {'email_pattern': EMAIL_PATTERN})
+        cursor.execute('''
+            INSERT INTO users_user (email, password, first_name, last_name, phone, city, telegram_id, telegram_nik,
+                                    is_active, is_staff, is_superuser, date_joined, updated_at)
+            SELECT email, password, first_name, last_name, phone, city, telegram_id, coalesce(telegram_nik, ''),
+                   true, false, false, %(now)s, %(now)s
+            FROM users_import WHERE error IS NULL
+            ON CONFLICT (email) DO NOTHING
+        ''', {'now': timezone.now()})
+        result['imported'] = cursor.rowcount
+        cursor.execute('SELECT count(*) FROM users_import WHERE error IS NOT NULL')
+        result['skipped'] = cursor.fetchone()[0]
+        cursor.execute('SELECT line, error FROM users_import WHERE error IS NOT NULL ORDER BY line LIMIT %s',
+                       [max_errors])
+        result['errors'] = cursor.fetchall()
+    return result
+
+
+def _import_users_bulk(rows, batch_size, max_errors):
+    result = get_import_result()
+    batch = {}
+
+    def flush():
+        existing = set(User.objects.filter(email__in=batch).values_list('email', flat=True))
+        users = []
+        for email, row in batch.items():
+            if email in existing:
+                add_import_error(result, row['line'], 'пользователь с такой почтой уже существует', max_errors)
+                continue
+            users.append(User(
+                email=email, password=get_import_password(row.get('password')),
+                **{column: row.get(column) or None for column in USER_COLUMNS[2:-1]},
+                telegram_nik=row.get('telegram_nik') or '',
+            ))
+        User.objects.bulk_create(users, batch_size=batch_size, ignore_conflicts=True)
+        result['imported'] += len(users)
+        batch.clear()
+
+    with transaction.atomic():
+        for row in rows:
+            email = (row.get('email') or '').strip()
+            error = _validate_user(email, row)
+            if error:
+                add_import_error(result, row['line'], error, max_errors)
+                continue
+            if email in batch:
+                add_import_error(result, batch[email]['line'], 'почта повторяется в файле', max_errors)
+            batch[email] = row
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    return result
+
+
+def _validate_user(email, row):
+    if not re.match(EMAIL_PATTERN, email):
+        return 'некорректная почта'
+    if len(email) > 254:
+        return 'слишком длинная почта'
+    if any(len(row.get(column) or '') > 50 for column in ('first_name', 'last_name', 'city', 'telegram_id',
+                                                          'telegram_nik')):
+        return 'слишком длинное значение'
+    if len(row.get('phone') or '') > 20:
+        return 'слишком длинный телефон'
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management import BaseCommand
+
+from users.importers import import_users, read_rows, write_import_result
+
+
+class Command(BaseCommand):
+    help = ('Импорт пользователей из CSV или NDJSON. Переносятся только готовые хэши паролей Django, '
+            'остальным пользователям нужно будет восстановить пароль')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл .csv, .ndjson или .jsonl, можно сжатый .gz')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='формат файла, по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=5000, help='размер пачки для bulk_create')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        result = import_users(read_rows(options['path'], options['format']), batch_size=options['batch_size'])
+        write_import_result(self, result, time.monotonic() - started)
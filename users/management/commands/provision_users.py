@@ -0,0 +1,53 @@
+import time
+
+from django.core.management import BaseCommand
+
+from users.importers import add_import_error, get_import_result, read_rows, write_import_result
+from users.provisioning import provision_users
+from users.serializers import EMAIL_EXISTS_MESSAGE, UserSerializer
+
+
+class Command(BaseCommand):
+    help = ('Создание пользователей из CSV или NDJSON с паролями в открытом виде. '
+            'Пароли хэшируются в нескольких процессах, пользователи записываются пачками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл .csv, .ndjson или .jsonl, можно сжатый .gz')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='формат файла, по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000, help='пользователей в одной пачке')
+        parser.add_argument('--max-errors', type=int, default=100, help='сколько ошибок выводить')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        result = get_import_result()
+        batch = {}
+        lines = {}
+
+        def flush():
+            users, existing = provision_users(list(batch.values()), options['batch_size'], processes=True)
+            result['imported'] += len(users)
+            for email in existing:
+                add_import_error(result, lines[email], EMAIL_EXISTS_MESSAGE, options['max_errors'])
+            batch.clear()
+            lines.clear()
+
+        for row in read_rows(options['path'], options['format']):
+            serializer = UserSerializer(data={key: value for key, value in row.items() if value not in (None, '')})
+            if not serializer.is_valid():
+                add_import_error(result, row['line'], _error_text(serializer.errors), options['max_errors'])
+                continue
+            email = serializer.validated_data['email']
+            if email in batch:
+                add_import_error(result, lines[email], 'почта повторяется в файле', options['max_errors'])
+            batch[email] = serializer.validated_data
+            lines[email] = row['line']
+            if len(batch) >= options['batch_size']:
+                flush()
+        if batch:
+            flush()
+        write_import_result(self, result, time.monotonic() - started)
+
+
+def _error_text(errors):
+    field, messages = next(iter(errors.items()))
+    return f'{field}: {messages[0]}'
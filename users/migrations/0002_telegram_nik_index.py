@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='telegram_nik',
+            field=models.CharField(db_index=True, max_length=50, verbose_name='Телеграм ник'),
+        ),
+    ]
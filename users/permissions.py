@@ -20,7 +20,7 @@ class IsModeratorOrSuperuser(permissions.BasePermission):
 
 
 class IsOwner(permissions.BasePermission):
+    message = "Вы не обладаете достаточными правами для данного действия"
+
     def has_object_permission(self, request, view, obj):
-        if request.user.id == obj.id:
-            return True
-        return "Вы не обладаете достаточными правами для данного действия"
+        return request.user.id == obj.id
@@ -0,0 +1,67 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from rest_framework.serializers import ValidationError
+
+from users.models import User
+from users.serializers import EMAIL_EXISTS_MESSAGE
+
+hash_executor = None
+hash_executor_lock = threading.Lock()
+
+
+def hash_passwords(passwords, processes=False):
+    """
+    Хэши паролей в том же порядке. Хэширование (PBKDF2) нагружает процессор.
+    processes=True (команда provision_users) - пароли делятся между USERS_HASH_WORKERS процессами.
+    В запросе процессы не запускаются: хэши считает общий пул из USERS_HASH_THREADS потоков,
+    PBKDF2 отпускает GIL, поэтому потоки считают параллельно
+    """
+    if not processes:
+        return list(get_hash_executor().map(make_password, passwords))
+    workers = min(settings.USERS_HASH_WORKERS or os.cpu_count() or 1, len(passwords))
+    if workers <= 1:
+        return [make_password(password) for password in passwords]
+    # процессу нужны настройки Django, чтобы знать алгоритм хэширования
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        return list(executor.map(make_password, passwords, chunksize=max(len(passwords) // (workers * 4), 1)))
+
+
+def get_hash_executor():
+    """
+    Пул потоков процесса для хэширования паролей в запросах, один на все запросы
+    """
+    global hash_executor
+    with hash_executor_lock:
+        if hash_executor is None:
+            hash_executor = ThreadPoolExecutor(max_workers=settings.USERS_HASH_THREADS,
+                                               thread_name_prefix='hash_passwords')
+        return hash_executor
+
+
+def provision_users(items, batch_size=1000, processes=False):
+    """
+    Создание пользователей из проверенных UserSerializer данных одним bulk_create.
+    Пользователи с уже существующей почтой не создаются. Возвращает созданных пользователей
+    и список почт, которые уже были в базе
+    """
+    emails = [item['email'] for item in items]
+    if len(set(emails)) != len(emails):
+        raise ValidationError({'email': 'Почта повторяется в запросе'})
+
+    existing = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+    items = [item for item in items if item['email'] not in existing]
+    passwords = hash_passwords([item['password'] for item in items], processes)
+    users = [User(**{**item, 'password': password}) for item, password in zip(items, passwords)]
+    try:
+        with transaction.atomic():
+            users = User.objects.bulk_create(users, batch_size=batch_size)
+    except IntegrityError:
+        # почту занял параллельный запрос после проверки
+        raise ValidationError({'email': EMAIL_EXISTS_MESSAGE})
+    return users, [email for email in emails if email in existing]
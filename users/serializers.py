@@ -1,8 +1,12 @@
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
 from users.models import User
-from users.validators import validate_unique_email
+
+EMAIL_EXISTS_MESSAGE = 'Пользователь с такой почтой уже существует'
 
 
 class UserSerializer(ModelSerializer):
@@ -11,11 +15,33 @@ class UserSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ['first_name', 'last_name', 'email', 'phone', 'city', 'avatar', 'telegram_id', 'telegram_nik', 'password', 'id']
-        validators = [validate_unique_email]
+        # уникальность почты проверяет ограничение в базе, без отдельного запроса EXISTS
+        extra_kwargs = {'email': {'validators': []}}
 
     def create(self, validated_data):
-        password = validated_data.pop('password')
-        user = super().create(validated_data)
-        user.set_password(password)
-        user.save()
+        """
+        Пароль хэшируется один раз, пользователь записывается одним INSERT
+        """
+        user = User(**validated_data)
+        user.set_password(validated_data['password'])
+        with email_exists_error(user.email):
+            user.save(force_insert=True)
         return user
+
+    def update(self, instance, validated_data):
+        with email_exists_error(validated_data.get('email', instance.email), exclude_pk=instance.pk):
+            return super().update(instance, validated_data)
+
+
+@contextmanager
+def email_exists_error(email, exclude_pk=None):
+    """
+    Нарушение уникальности почты в базе превращается в ошибку валидации вместо ответа 500
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError:
+        if User.objects.filter(email=email).exclude(pk=exclude_pk).exists():
+            raise serializers.ValidationError({'email': [EMAIL_EXISTS_MESSAGE]})
+        raise
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import bump_user_version
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_auth_cache(sender, instance, **kwargs):
+    """
+    Сбрасывает закэшированные для аутентификации данные пользователя
+    """
+    bump_user_version(instance.pk)
@@ -1,8 +1,21 @@
-from django.test import TestCase
+import io
+import json
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.importers import with_import_passwords
+from users.serializers import EMAIL_EXISTS_MESSAGE
 
 
 class UserCreateAPIViewTest(APITestCase):
@@ -237,4 +250,186 @@ class UserProfileUpdateAPIViewTest(APITestCase):
         """Проверяем, что профиль пользователя не был изменен"""
 
         self.user.refresh_from_db()
-        self.assertNotEqual(self.user.first_name, 'Updated First Name')
\ No newline at end of file
+        self.assertNotEqual(self.user.first_name, 'Updated First Name')
+
+
+class UserConditionalGetTest(APITestCase):
+
+    def test_get_user_not_modified(self):
+        """
+        Проверяем ответ 304 для неизмененного пользователя и 200 после изменения
+        """
+        user = get_user_model().objects.create(email='etag@example.com', is_staff=True)
+        self.client.force_authenticate(user)
+        url = reverse('users:user_retrieve', args=[user.pk])
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        user.city = 'Moscow'
+        user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CachedJWTAuthenticationTest(APITestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(email='jwt@example.com')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        # в тестах один процесс, кэш в памяти заменяет Redis
+        patcher = patch('users.authentication.is_shared_cache', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_user_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [q for q in queries if 'FROM "users_user"' in q['sql']]
+
+    def test_user_is_cached(self):
+        """
+        Проверяем, что пользователь читается из базы только при первом запросе,
+        а изменение пользователя сразу учитывается в проверке прав
+        """
+        url = reverse('users:user_list')
+        response, user_queries = self.get_user_queries(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(len(user_queries), 1)
+
+        response, user_queries = self.get_user_queries(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(user_queries, [])
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_inactive_and_deleted_user(self):
+        url = reverse('users:user_list')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_process_cache_is_not_used(self):
+        """
+        Проверяем, что с кэшем в памяти процесса пользователь читается из базы на каждый запрос
+        """
+        url = reverse('users:user_list')
+        with patch('users.authentication.is_shared_cache', return_value=False):
+            for _ in range(2):
+                response, user_queries = self.get_user_queries(url)
+                self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+                self.assertEqual(len(user_queries), 1)
+
+
+class ImportUsersCommandTest(TestCase):
+
+    def test_import_users_ndjson(self):
+        get_user_model().objects.create(email='exists@example.com')
+        rows = [
+            {'email': 'new@example.com', 'password': 'pbkdf2_sha256$600000$salt$hash', 'telegram_nik': 'new'},
+            {'email': 'plain@example.com', 'password': 'secret', 'city': 'Moscow'},
+            {'email': 'dollar@example.com', 'password': 'summer$2024'},
+            {'email': 'exists@example.com'},
+            {'email': 'not-an-email'},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write('\n'.join(json.dumps(row) for row in rows))
+            file.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command('import_users', file.name, stdout=out, stderr=err)
+
+        self.assertIn('Загружено: 3, пропущено: 2', out.getvalue())
+        self.assertIn('Строка 5: некорректная почта', err.getvalue())
+        users = get_user_model().objects
+        self.assertEqual(users.get(email='new@example.com').password, 'pbkdf2_sha256$600000$salt$hash')
+        self.assertFalse(users.get(email='plain@example.com').has_usable_password())
+        # похоже на хэш, но алгоритма summer нет в PASSWORD_HASHERS: пароль не сохраняется
+        self.assertFalse(users.get(email='dollar@example.com').has_usable_password())
+        self.assertNotEqual(users.get(email='dollar@example.com').password, 'summer$2024')
+
+    def test_copy_passwords(self):
+        """
+        Проверяем, что для COPY пароли заменяются по тому же правилу, что и в bulk_create
+        """
+        rows = with_import_passwords([{'line': 1, 'password': 'pbkdf2_sha256$600000$salt$hash'},
+                                      {'line': 2, 'password': 'summer$2024'}, {'line': 3}])
+        passwords = [row['password'] for row in rows]
+        self.assertEqual(passwords[0], 'pbkdf2_sha256$600000$salt$hash')
+        self.assertTrue(all(password.startswith('!') for password in passwords[1:]))
+
+
+class UserRegistrationTest(APITestCase):
+
+    def test_register_with_single_insert(self):
+        """
+        Проверяем, что регистрация записывает пользователя одним запросом без проверки EXISTS,
+        а занятая почта возвращает ошибку валидации
+        """
+        data = {'email': 'signup@example.com', 'password': 'secret', 'telegram_nik': 'signup'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('users:user_create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([q['sql'].split()[0] for q in queries if 'users_user' in q['sql']], ['INSERT'])
+        self.assertTrue(get_user_model().objects.get(email='signup@example.com').check_password('secret'))
+
+        response = self.client.post(reverse('users:user_create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', response.json())
+
+    def test_bulk_create_users(self):
+        admin = get_user_model().objects.create(email='admin@example.com', is_staff=True)
+        get_user_model().objects.create(email='exists@example.com')
+        self.client.force_authenticate(admin)
+        data = [{'email': f'{name}@example.com', 'password': f'{name}-secret', 'telegram_nik': name}
+                for name in ('first', 'second', 'exists')]
+
+        # запрос не запускает процессы для хэширования
+        with patch('users.provisioning.ProcessPoolExecutor') as executor:
+            response = self.client.post(reverse('users:user_bulk'), data, format='json')
+        executor.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([user['email'] for user in response.json()['created']],
+                         ['first@example.com', 'second@example.com'])
+        self.assertEqual(response.json()['existing'], ['exists@example.com'])
+        self.assertTrue(get_user_model().objects.get(email='second@example.com').check_password('second-secret'))
+
+        response = self.client.post(reverse('users:user_bulk'), data[:1] * 2, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_to_existing_email(self):
+        """
+        Проверяем, что смена почты на занятую возвращает ошибку валидации, а не 500
+        """
+        user = get_user_model().objects.create(email='update@example.com')
+        get_user_model().objects.create(email='taken@example.com')
+        self.client.force_authenticate(user)
+        url = reverse('users:user_update', args=[user.pk])
+
+        response = self.client.patch(url, {'email': 'taken@example.com'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {'email': [EMAIL_EXISTS_MESSAGE]})
+
+        response = self.client.patch(url, {'email': 'update@example.com', 'city': 'Kazan'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(USERS_HASH_WORKERS=2)
+    def test_provision_users_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write('email,password,telegram_nik,city\n'
+                       'one@example.com,one-secret,one,Moscow\n'
+                       'broken,secret,broken,\n'
+                       'two@example.com,two-secret,two,\n')
+            file.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command('provision_users', file.name, stdout=out, stderr=err)
+
+        self.assertIn('Загружено: 2, пропущено: 1', out.getvalue())
+        self.assertIn('Строка 3: email:', err.getvalue())
+        self.assertTrue(get_user_model().objects.get(email='one@example.com').check_password('one-secret'))
@@ -1,6 +1,6 @@
 from django.urls import path
 from users.views import UserCreateAPIView, UserDestroyAPIView, UserListAPIView, UserRetrieveAPIView, \
-    UserProfileUpdateAPIView
+    UserProfileUpdateAPIView, UserBulkCreateAPIView
 from users.apps import UsersConfig
 from rest_framework_simplejwt.views import (TokenObtainPairView, TokenRefreshView, )
 
@@ -10,6 +10,7 @@ urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('create/', UserCreateAPIView.as_view(), name='user_create'),
+    path('bulk/', UserBulkCreateAPIView.as_view(), name='user_bulk'),
     path('<int:pk>/', UserRetrieveAPIView.as_view(), name='user_retrieve'),
     path('<int:pk>/update/', UserProfileUpdateAPIView.as_view(), name='user_update'),
     path('<int:pk>/destroy/', UserDestroyAPIView.as_view(), name='user_destroy'),
@@ -1,7 +1,11 @@
-from rest_framework.generics import CreateAPIView, DestroyAPIView, ListAPIView, RetrieveAPIView, \
-    RetrieveUpdateAPIView
+from django.conf import settings
+from rest_framework.generics import CreateAPIView, DestroyAPIView, ListAPIView, RetrieveUpdateAPIView
+from rest_framework.views import APIView
 
+from users.async_views import AsyncRetrieveAPIView
+from users.conditional import conditional_get
 from users.pagination import UserPagination
+from users.provisioning import provision_users
 from users.permissions import IsModeratorOrOwner, IsModeratorOrSuperuser, IsOwner
 from users.serializers import UserSerializer
 from users.models import User
@@ -9,6 +13,11 @@ from rest_framework import permissions, status
 from rest_framework.response import Response
 
 
+def get_user_state(request, pk):
+    updated_at = User.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return None if updated_at is None else (updated_at, pk)
+
+
 class UserCreateAPIView(CreateAPIView):
     """
     Эндпоинт для создания пользователя
@@ -17,10 +26,20 @@ class UserCreateAPIView(CreateAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
 
-    def perform_create(self, serializer):
-        user = serializer.save()
-        user.set_password(serializer.validated_data['password'])
-        user.save()
+
+class UserBulkCreateAPIView(APIView):
+    """
+    Эндпоинт для пакетного создания пользователей, например всех сотрудников организации.
+    Пользователи с уже существующей почтой пропускаются и возвращаются в existing
+    """
+    permission_classes = [permissions.IsAuthenticated, IsModeratorOrSuperuser]
+
+    def post(self, request):
+        serializer = UserSerializer(data=request.data, many=True, max_length=settings.USERS_BULK_MAX_SIZE)
+        serializer.is_valid(raise_exception=True)
+        users, existing = provision_users(serializer.validated_data)
+        return Response({'created': UserSerializer(users, many=True).data, 'existing': existing},
+                        status=status.HTTP_201_CREATED)
 
 
 class UserDestroyAPIView(DestroyAPIView):
@@ -42,14 +61,18 @@ class UserListAPIView(ListAPIView):
     permission_classes = [permissions.IsAuthenticated, IsModeratorOrSuperuser]
 
 
-class UserRetrieveAPIView(RetrieveAPIView):
+class UserRetrieveAPIView(AsyncRetrieveAPIView):
     """
-    Эндпоинт для просмотра одного пользователя
+    Эндпоинт для просмотра одного пользователя (асинхронный)
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated, IsModeratorOrOwner, IsModeratorOrSuperuser]
 
+    @conditional_get(get_user_state)
+    async def get(self, request, *args, **kwargs):
+        return await super().get(request, *args, **kwargs)
+
 
 class UserProfileUpdateAPIView(RetrieveUpdateAPIView):
     """
@@ -59,7 +82,8 @@ class UserProfileUpdateAPIView(RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated, IsOwner]
 
     def get_object(self):
-        return self.request.user
+        # request.user собран из кэша аутентификации и содержит не все поля
+        return User.objects.get(pk=self.request.user.pk)
 
     def update(self, request, *args, **kwargs):
         if self.get_object() != self.request.user: